@@ -9,6 +9,10 @@ from langchain_community.vectorstores import FAISS
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain.docstore.document import Document
 
+# Расширения таблиц и изображений (множества создаются один раз при загрузке модуля)
+EXCEL_EXTENSIONS = frozenset({'.xlsx', '.xls'})
+IMAGE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.webp'})
+
 class DocumentProcessor:
     def __init__(self):
         # Инициализация векторного хранилища с пустым набором
@@ -40,11 +44,11 @@ class DocumentProcessor:
                 document_text = self.extract_text_from_docx(file_path)
             elif file_extension == '.pdf':
                 document_text = self.extract_text_from_pdf(file_path)
-            elif file_extension in ['.xlsx', '.xls']:
+            elif file_extension in EXCEL_EXTENSIONS:
                 document_text = self.extract_text_from_excel(file_path)
             elif file_extension == '.txt':
                 document_text = self.extract_text_from_txt(file_path)
-            elif file_extension in ['.jpg', '.jpeg', '.png', '.webp']:
+            elif file_extension in IMAGE_EXTENSIONS:
                 document_text = self.extract_text_from_image(file_path)
             else:
                 return False, f"Неподдерживаемый формат файла: {file_extension}"
@@ -16,7 +16,7 @@ from PyQt6.QtCore import Qt, QSize, QPropertyAnimation, QEasingCurve, QObject, p
 from PyQt6.QtGui import QFont, QIcon, QColor, QTextCursor, QTextDocument
 
 # Импорты для распознавания голоса
-from vosk import Model, KaldiRecognizer
+from vosk import KaldiRecognizer
 import sounddevice as sd
 
 # Добавим в импорты pyperclip для более надежного копирования
@@ -24,7 +24,7 @@ import pyperclip
 
 from agent import ask_agent, update_model_settings, model_settings, reload_model_by_path, get_model_info
 from memory import save_to_memory
-from voice import speak_text, check_vosk_model, VOSK_MODEL_PATH, SAMPLE_RATE
+from voice import speak_text, check_vosk_model, get_vosk_model, SAMPLE_RATE
 from document_processor import DocumentProcessor
 from transcriber import Transcriber
 from online_transcription import OnlineTranscriber
@@ -167,8 +167,9 @@ class VoiceRecognitionThread(QThread):
             return
             
         try:
-            model = Model(VOSK_MODEL_PATH)
-            q = queue.Queue()
+            model = get_vosk_model()
+            # SimpleQueue реализована на C: put в callback'е дешевле, чем у Queue с ее условными переменными
+            q = queue.SimpleQueue()
             
             def callback(indata, frames, time, status):
                 if status:
@@ -1,33 +1,117 @@
 import os
+import re
 import sys
 import json
 import time
 import queue
 import threading
+import shutil
 import tempfile
+import wave
 import numpy as np
 import sounddevice as sd
 from vosk import Model, KaldiRecognizer
 from datetime import datetime
 
+# orjson (если установлен) разбирает результаты распознавания быстрее стандартного json
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
 # Импортируем наш класс для записи системного звука
-from system_audio import SystemAudioRecorder
+from system_audio import SystemAudioRecorder, query_audio_devices
 # Новый импорт для использования улучшенной реализации записи системного звука
 from system_audio_capture import WasapiLoopbackCapture
 
+# Ключевые слова в названиях устройств стерео микшера
+MIXER_KEYWORDS = ('stereo mix', 'mixer', 'mix', 'микшер')
+_MIXER_DEVICE_RE = re.compile('|'.join(map(re.escape, MIXER_KEYWORDS)), re.IGNORECASE)
+
+# Поле "text" в JSON-результате Vosk
+_RESULT_TEXT_RE = re.compile(r'"text"\s*:\s*"([^"]*)"')
+
+def _result_text(raw_result):
+    """Извлекает текст из JSON-результата Vosk без полного разбора JSON"""
+    match = _RESULT_TEXT_RE.search(raw_result)
+    if not match:
+        return ""
+    text = match.group(1)
+    if '\\' in text:
+        # Экранированные символы встречаются редко - в этом случае разбираем JSON целиком
+        return json_loads(raw_result).get("text", "")
+    return text
+
+class AudioRingBuffer:
+    """Кольцевой буфер сэмплов int16 между callback'ом PortAudio и потоком распознавания"""
+    
+    def __init__(self, capacity):
+        # Память выделяется один раз: callback только копирует в нее данные, без новых объектов
+        self.data = np.zeros(capacity, dtype=np.int16)
+        self.capacity = capacity
+        # Абсолютные счетчики записанных и прочитанных сэмплов
+        self.write_pos = 0
+        self.read_pos = 0
+        self.lock = threading.Lock()
+    
+    def write(self, samples):
+        """Копирует сэмплы в буфер; при переполнении теряются самые старые данные"""
+        if samples.size > self.capacity:
+            samples = samples[-self.capacity:]
+        count = samples.size
+        with self.lock:
+            start = self.write_pos % self.capacity
+            first = min(count, self.capacity - start)
+            self.data[start:start + first] = samples[:first]
+            self.data[:count - first] = samples[first:]
+            self.write_pos += count
+            if self.write_pos - self.read_pos > self.capacity:
+                self.read_pos = self.write_pos - self.capacity
+    
+    def read(self, max_samples):
+        """Забирает до max_samples накопленных сэмплов одним блоком bytes (None, если пусто)"""
+        with self.lock:
+            count = min(self.write_pos - self.read_pos, max_samples)
+            if count == 0:
+                return None
+            start = self.read_pos % self.capacity
+            first = min(count, self.capacity - start)
+            if first == count:
+                data = self.data[start:start + count].tobytes()
+            else:
+                data = self.data[start:].tobytes() + self.data[:count - first].tobytes()
+            self.read_pos += count
+        return data
+    
+    def clear(self):
+        """Отбрасывает непрочитанные данные"""
+        with self.lock:
+            self.read_pos = self.write_pos
+
 class OnlineTranscriber:
+    # Максимальный объем аудио (байт), передаваемый в AcceptWaveform за один вызов (~2 сек при 16 кГц)
+    MAX_BATCH_BYTES = 64000
+    
+    # Емкость буфера каждого источника (сек): столько аудио может ждать распознавания
+    AUDIO_BUFFER_SECONDS = 60
+    
     def __init__(self):
         self.model = None
         self.mic_recognizer = None
         self.system_recognizer = None
-        self.temp_dir = tempfile.mkdtemp()
+        # Пул распознавателей: после Reset() они переиспользуются, а не создаются заново
+        self.recognizer_pool = queue.SimpleQueue()
+        self._temp_dir = None  # Создается по требованию, см. temp_dir
         self.language = "ru"  # По умолчанию русский
         self.vosk_model_path = "model_small"  # Путь к модели Vosk
         self.sample_rate = 16000
         
-        # Очереди для аудиоданных
-        self.mic_queue = queue.Queue()
-        self.system_queue = queue.Queue()
+        # Буферы для аудиоданных (выделяются один раз, callback'и только копируют в них)
+        self.mic_buffer = AudioRingBuffer(self.sample_rate * self.AUDIO_BUFFER_SECONDS)
+        self.system_buffer = AudioRingBuffer(self.sample_rate * self.AUDIO_BUFFER_SECONDS)
+        # Сигнал о поступлении новых данных в любой из буферов
+        self.audio_event = threading.Event()
         
         # Флаги для управления потоками
         self.is_running = False
@@ -37,6 +121,10 @@ class OnlineTranscriber:
         # Накопленный текст
         self.transcript = []
         
+        # Смещение монотонных часов относительно начала суток для меток времени
+        self.clock_offset = 0.0
+        self.sync_clock()
+        
         # Результаты распознавания
         self.results_callback = None
         
@@ -56,9 +144,9 @@ class OnlineTranscriber:
             print(f"Загрузка модели Vosk из {self.vosk_model_path}...")
             self.model = Model(self.vosk_model_path)
             
-            # Создаем распознаватели
-            self.mic_recognizer = KaldiRecognizer(self.model, self.sample_rate)
-            self.system_recognizer = KaldiRecognizer(self.model, self.sample_rate)
+            # Распознаватели привязаны к модели, поэтому старые из пула больше не годятся.
+            # Сами распознаватели создаются по требованию в acquire_recognizer
+            self.recognizer_pool = queue.SimpleQueue()
             
             print("Модель Vosk успешно загружена")
             return True
@@ -66,69 +154,118 @@ class OnlineTranscriber:
             print(f"Ошибка при загрузке модели Vosk: {str(e)}")
             return False
     
+    @property
+    def temp_dir(self):
+        """Временная директория для записей, создается при первом обращении"""
+        if self._temp_dir is None:
+            self._temp_dir = tempfile.mkdtemp(prefix="memoai_")
+        return self._temp_dir
+    
+    def cleanup(self):
+        """Удаляет временную директорию с записями"""
+        if self._temp_dir is not None:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+            self._temp_dir = None
+        
+        for recorder in (self.system_audio_recorder, self.wasapi_recorder):
+            if recorder:
+                recorder.cleanup()
+    
+    def sync_clock(self):
+        """Привязывает монотонные часы к текущему времени суток"""
+        now = datetime.now()
+        seconds_of_day = now.hour * 3600 + now.minute * 60 + now.second + now.microsecond / 1e6
+        self.clock_offset = seconds_of_day - time.monotonic()
+    
+    def timestamp(self):
+        """Метка времени ЧЧ:ММ:СС для записи стенограммы без datetime.now/strftime"""
+        seconds = int(time.monotonic() + self.clock_offset) % 86400
+        hours, rest = divmod(seconds, 3600)
+        minutes, seconds = divmod(rest, 60)
+        return "%02d:%02d:%02d" % (hours, minutes, seconds)
+    
+    def acquire_recognizer(self):
+        """Берет распознаватель из пула или создает новый, если пул пуст"""
+        try:
+            recognizer = self.recognizer_pool.get_nowait()
+            recognizer.Reset()
+        except queue.Empty:
+            recognizer = KaldiRecognizer(self.model, self.sample_rate)
+            # Нам нужен только текст, поэтому отключаем выдачу пословных меток времени
+            recognizer.SetWords(False)
+        return recognizer
+    
+    def release_recognizer(self, recognizer):
+        """Возвращает распознаватель в пул для повторного использования"""
+        if recognizer is not None:
+            self.recognizer_pool.put(recognizer)
+    
+    def read_batch(self, audio_buffer):
+        """Забирает накопившееся в буфере аудио, чтобы передать его в Vosk одним вызовом"""
+        return audio_buffer.read(self.MAX_BATCH_BYTES // 2)
+    
+    def add_entry(self, speaker, text):
+        """Добавляет фрагмент в стенограмму и передает его в callback"""
+        entry = {"time": self.timestamp(), "speaker": speaker, "text": text}
+        self.transcript.append(entry)
+        
+        if self.results_callback:
+            self.results_callback(entry)
+    
     def mic_callback(self, indata, frames, time, status):
         """Callback для захвата аудио с микрофона"""
         if status:
             print(f"Статус микрофона: {status}")
         if self.capture_mic:
-            self.mic_queue.put(bytes(indata))
+            self.mic_buffer.write(indata.reshape(-1))
+            self.audio_event.set()
     
     def system_callback(self, indata, frames, time, status):
         """Callback для захвата системного аудио"""
         if status:
             print(f"Статус системного аудио: {status}")
         if self.capture_system:
-            self.system_queue.put(bytes(indata))
+            self.system_buffer.write(indata.reshape(-1))
+            self.audio_event.set()
     
-    def process_mic_audio(self):
-        """Обработка аудио с микрофона"""
-        print("Начало обработки аудио с микрофона")
+    def process_audio(self):
+        """Обработка аудио с микрофона и системного звука в одном потоке"""
+        print("Начало обработки аудио")
         
-        while self.is_running:
-            try:
-                data = self.mic_queue.get(timeout=1)
-                if self.mic_recognizer.AcceptWaveform(data):
-                    result = json.loads(self.mic_recognizer.Result())
-                    text = result.get("text", "").strip()
-                    if text:
-                        timestamp = datetime.now().strftime("%H:%M:%S")
-                        speaker = "Вы"
-                        entry = {"time": timestamp, "speaker": speaker, "text": text}
-                        self.transcript.append(entry)
-                        
-                        if self.results_callback:
-                            self.results_callback(entry)
-            except queue.Empty:
-                pass
-            except Exception as e:
-                print(f"Ошибка при обработке аудио с микрофона: {str(e)}")
-    
-    def process_system_audio(self):
-        """Обработка системного аудио"""
-        print("Начало обработки системного аудио")
+        # У каждого источника свой распознаватель: состояние декодера нельзя смешивать
+        sources = (
+            (self.mic_buffer, "mic_recognizer", "Вы"),
+            (self.system_buffer, "system_recognizer", "Собеседник"),
+        )
         
         while self.is_running:
-            try:
-                data = self.system_queue.get(timeout=1)
-                if self.system_recognizer.AcceptWaveform(data):
-                    result = json.loads(self.system_recognizer.Result())
-                    text = result.get("text", "").strip()
-                    if text:
-                        timestamp = datetime.now().strftime("%H:%M:%S")
-                        speaker = "Собеседник"
-                        entry = {"time": timestamp, "speaker": speaker, "text": text}
-                        self.transcript.append(entry)
-                        
-                        if self.results_callback:
-                            self.results_callback(entry)
-            except queue.Empty:
-                pass
-            except Exception as e:
-                print(f"Ошибка при обработке системного аудио: {str(e)}")
+            # Callback'и сигналят о новых данных, поэтому короткий таймаут нужен только для остановки
+            self.audio_event.wait(0.05)
+            self.audio_event.clear()
+            
+            for audio_buffer, recognizer_name, speaker in sources:
+                recognizer = getattr(self, recognizer_name)
+                if recognizer is None:
+                    continue
                 
+                try:
+                    while True:
+                        data = self.read_batch(audio_buffer)
+                        if data is None:
+                            break
+                        
+                        if recognizer.AcceptWaveform(data):
+                            text = _result_text(recognizer.Result()).strip()
+                            if text:
+                                self.add_entry(speaker, text)
+                except Exception as e:
+                    print(f"Ошибка при обработке аудио ({speaker}): {str(e)}")
+    
     def process_meeting_recording(self):
         """Периодически останавливает и обрабатывает запись встречи"""
         segment_duration = 10  # Длительность каждого сегмента в секундах
+        # Рекордер запоминаем на старте: при следующем запуске транскрибации создается новый
+        recorder = self.system_audio_recorder if self.using_system_recorder else self.wasapi_recorder
         
         while self.is_running:
             try:
@@ -148,42 +285,40 @@ class OnlineTranscriber:
                     # Транскрибируем временный файл
                     print(f"Транскрибация сегмента: {audio_file}")
                     
-                    # Создаем временный распознаватель для этого файла
-                    segment_recognizer = KaldiRecognizer(self.model, self.sample_rate)
-                    
                     # Открываем и обрабатываем аудиофайл
-                    with open(audio_file, "rb") as wf:
-                        wf.read(44)  # Пропускаем WAV-заголовок
+                    with wave.open(audio_file, "rb") as wf:
+                        # Loopback-запись может идти с родной частотой устройства вывода,
+                        # поэтому распознаватель создаем под частоту файла
+                        segment_rate = wf.getframerate()
+                        if segment_rate == self.sample_rate:
+                            segment_recognizer = self.acquire_recognizer()
+                        else:
+                            segment_recognizer = KaldiRecognizer(self.model, segment_rate)
+                            segment_recognizer.SetWords(False)
                         
-                        # Обрабатываем файл блоками
-                        while True:
-                            data = wf.read(4000)
-                            if len(data) == 0:
-                                break
-                                
-                            if segment_recognizer.AcceptWaveform(data):
-                                result = json.loads(segment_recognizer.Result())
-                                text = result.get("text", "").strip()
-                                
-                                if text:
-                                    timestamp = datetime.now().strftime("%H:%M:%S")
-                                    entry = {"time": timestamp, "speaker": "Разговор", "text": text}
-                                    self.transcript.append(entry)
+                        try:
+                            # Обрабатываем файл блоками
+                            while True:
+                                data = wf.readframes(2000)
+                                if len(data) == 0:
+                                    break
                                     
-                                    if self.results_callback:
-                                        self.results_callback(entry)
-                    
-                    # Обрабатываем последний фрагмент
-                    result = json.loads(segment_recognizer.FinalResult())
-                    text = result.get("text", "").strip()
-                    
-                    if text:
-                        timestamp = datetime.now().strftime("%H:%M:%S")
-                        entry = {"time": timestamp, "speaker": "Разговор", "text": text}
-                        self.transcript.append(entry)
-                        
-                        if self.results_callback:
-                            self.results_callback(entry)
+                                if segment_recognizer.AcceptWaveform(data):
+                                    text = _result_text(segment_recognizer.Result()).strip()
+                                    
+                                    if text:
+                                        self.add_entry("Разговор", text)
+                            
+                            # Обрабатываем последний фрагмент
+                            text = _result_text(segment_recognizer.FinalResult()).strip()
+                            
+                            if text:
+                                self.add_entry("Разговор", text)
+                        finally:
+                            # Возвращаем распознаватель в пул и при ошибке декодирования,
+                            # иначе каждый сбойный сегмент уносил бы его из пула
+                            if segment_rate == self.sample_rate:
+                                self.release_recognizer(segment_recognizer)
                 
                 # Перезапускаем запись для следующего сегмента, если транскрибация еще идет
                 if self.is_running:
@@ -197,6 +332,10 @@ class OnlineTranscriber:
                     
             except Exception as e:
                 print(f"Ошибка при обработке записи встречи: {str(e)}")
+        
+        # Транскрибация остановлена - временные записи этого рекордера больше не нужны
+        if recorder:
+            recorder.cleanup()
     
     def start_transcription(self, results_callback=None, capture_mic=True, capture_system=True, mic_device=None, system_device=None, use_wasapi=False):
         """
@@ -218,12 +357,17 @@ class OnlineTranscriber:
             if not self.load_model():
                 return False
                 
+        self.sync_clock()
         self.capture_mic = capture_mic
         self.capture_system = capture_system
         self.results_callback = results_callback
         self.system_audio_device = system_device
         self.mic_audio_device = mic_device
         
+        # Непрочитанный звук прошлого запуска не должен попасть в новый распознаватель
+        self.mic_buffer.clear()
+        self.system_buffer.clear()
+        
         if capture_mic and not capture_system:
             # Только микрофон
             try:
@@ -242,16 +386,17 @@ class OnlineTranscriber:
                 self.mic_stream.start()
                 
                 # Запускаем поток обработки аудио с микрофона
-                self.mic_thread = threading.Thread(target=self.process_mic_audio)
-                self.mic_thread.daemon = True
-                self.mic_thread.start()
+                self.mic_recognizer = self.acquire_recognizer()
+                self.audio_thread = threading.Thread(target=self.process_audio)
+                self.audio_thread.daemon = True
+                self.audio_thread.start()
                 
                 print(f"Транскрибация начата (только микрофон)")
                 
                 # Уведомляем о начале через callback
                 if self.results_callback:
                     start_entry = {
-                        "time": datetime.now().strftime("%H:%M:%S"),
+                        "time": self.timestamp(),
                         "speaker": "Система",
                         "text": "Запись совещания началась. Говорите в микрофон."
                     }
@@ -304,9 +449,10 @@ class OnlineTranscriber:
                     self.mic_stream.start()
                     
                     # Запускаем поток обработки аудио с микрофона
-                    self.mic_thread = threading.Thread(target=self.process_mic_audio)
-                    self.mic_thread.daemon = True
-                    self.mic_thread.start()
+                    self.mic_recognizer = self.acquire_recognizer()
+                    self.audio_thread = threading.Thread(target=self.process_audio)
+                    self.audio_thread.daemon = True
+                    self.audio_thread.start()
                 
                 print(f"Транскрибация начата (системный звук {'+ микрофон' if capture_mic else ''})")
                 
@@ -314,7 +460,7 @@ class OnlineTranscriber:
                 if self.results_callback:
                     msg = "Используется улучшенная запись системного звука" if use_wasapi else "Используется стандартная запись системного звука"
                     start_entry = {
-                        "time": datetime.now().strftime("%H:%M:%S"),
+                        "time": self.timestamp(),
                         "speaker": "Система",
                         "text": f"Запись совещания началась. {msg}. Голоса участников будут распознаны."
                     }
@@ -353,20 +499,29 @@ class OnlineTranscriber:
                 self.wasapi_recorder.stop_recording()
                 
             # Ждем завершения потоков
-            if hasattr(self, 'mic_thread') and self.mic_thread and self.mic_thread.is_alive():
-                self.mic_thread.join(timeout=2)
-                
-            if hasattr(self, 'system_thread') and self.system_thread and self.system_thread.is_alive():
-                self.system_thread.join(timeout=2)
+            if hasattr(self, 'audio_thread') and self.audio_thread and self.audio_thread.is_alive():
+                self.audio_event.set()
+                self.audio_thread.join(timeout=2)
                 
             if hasattr(self, 'meeting_thread') and self.meeting_thread and self.meeting_thread.is_alive():
                 self.meeting_thread.join(timeout=2)
+            
+            # Возвращаем распознаватели в пул для следующего запуска
+            self.release_recognizer(self.mic_recognizer)
+            self.release_recognizer(self.system_recognizer)
+            self.mic_recognizer = None
+            self.system_recognizer = None
+            
+            # Записи больше не нужны - удаляем временные директории. Если поток обработки встречи
+            # еще дочитывает последний сегмент, он удалит записи своего рекордера сам при выходе
+            if not (hasattr(self, 'meeting_thread') and self.meeting_thread and self.meeting_thread.is_alive()):
+                self.cleanup()
                 
             # Уведомляем о завершении через callback
             if self.results_callback:
                 fragments_count = len(self.transcript)
                 end_entry = {
-                    "time": datetime.now().strftime("%H:%M:%S"),
+                    "time": self.timestamp(),
                     "speaker": "Система",
                     "text": f"Запись совещания завершена. Всего записано {fragments_count} фрагментов."
                 }
@@ -409,6 +564,7 @@ class OnlineTranscriber:
             
             # Ищем устройства для записи системного звука
             system_devices = []
+            found_indexes = set()
             
             # Проверяем, есть ли Stereo Mix среди устройств
             if devices.get('system_device'):
@@ -417,13 +573,14 @@ class OnlineTranscriber:
                     'name': devices['system_device']['name'],
                     'is_default': True
                 })
+                found_indexes.add(devices['system_device']['index'])
             
             # Ищем другие потенциальные устройства
             for device in devices.get('all_devices', []):
-                if 'input' in device.get('type', []) and device.get('index') not in [d['index'] for d in system_devices]:
-                    lower_name = device.get('name', '').lower()
+                if 'input' in device.get('type', []) and device.get('index') not in found_indexes:
                     # Ищем потенциальные устройства для системного звука
-                    if any(keyword in lower_name for keyword in ['stereo mix', 'mixer', 'mix', 'микшер']):
+                    if device.get('is_system') or _MIXER_DEVICE_RE.search(device.get('name', '')):
+                        found_indexes.add(device['index'])
                         system_devices.append({
                             'index': device['index'],
                             'name': device['name'],
@@ -463,22 +620,14 @@ class OnlineTranscriber:
         """Получить список устройств микрофона"""
         mic_devices = []
         try:
-            import pyaudio
-            p = pyaudio.PyAudio()
-            
             # Получаем список всех устройств
-            for i in range(p.get_device_count()):
-                dev_info = p.get_device_info_by_index(i)
-                
+            for i, dev_info in enumerate(query_audio_devices()):
                 # Проверяем, является ли устройство микрофоном
-                if dev_info.get('maxInputChannels', 0) > 0:
+                if dev_info.get('max_input_channels', 0) > 0:
                     name = dev_info.get('name', f'Микрофон {i}')
                     
                     # Проверяем, не является ли это устройство стерео микшером
-                    is_stereo_mix = False
-                    lower_name = name.lower()
-                    if any(keyword in lower_name for keyword in ['stereo mix', 'mixer', 'mix', 'микшер']):
-                        is_stereo_mix = True
+                    is_stereo_mix = _MIXER_DEVICE_RE.search(name) is not None
                     
                     if not is_stereo_mix:
                         mic_devices.append({
@@ -486,8 +635,6 @@ class OnlineTranscriber:
                             'name': name,
                         })
             
-            p.terminate()
-            
         except Exception as e:
             print(f"Ошибка при получении устройств микрофона: {str(e)}")
         
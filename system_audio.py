@@ -1,42 +1,153 @@
 import os
+import re
+import shutil
 import tempfile
 import time
 import wave
 import numpy as np
 import threading
 import platform
-import pyaudio
 import sounddevice as sd
 import soundfile as sf
-from comtypes import CLSCTX_ALL
-from pycaw.pycaw import AudioUtilities, IAudioEndpointVolume
+
+# Numba (если установлена) ускоряет микширование длинных записей
+try:
+    from numba import njit, prange
+    numba_available = True
+except ImportError:
+    numba_available = False
+
+if numba_available:
+    @njit(parallel=True, cache=True, boundscheck=False)
+    def _mix_int16_numba(mic, system, out):
+        """Складывает, ограничивает и приводит к int16 за один проход по памяти"""
+        for i in prange(out.shape[0]):
+            value = np.int32(mic[i]) + np.int32(system[i])
+            if value > 32767:
+                value = 32767
+            elif value < -32768:
+                value = -32768
+            out[i] = np.int16(value)
+
+    @njit('float64(int16[::1])', cache=True, fastmath=True)
+    def _rms_int16_numba(samples):
+        """Среднеквадратичный уровень int16 с целочисленным накоплением суммы квадратов"""
+        total = np.int64(0)
+        for i in range(samples.shape[0]):
+            value = np.int64(samples[i])
+            total += value * value
+        return np.sqrt(total / samples.shape[0])
+
+def rms_int16(samples):
+    """Возвращает среднеквадратичный уровень сигнала int16 (0 для пустого массива)"""
+    if samples.size == 0:
+        return 0.0
+    if numba_available and samples.flags.c_contiguous:
+        return _rms_int16_numba(samples)
+    wide = samples.astype(np.int64)
+    return float(np.sqrt(np.dot(wide, wide) / samples.size))
+
+def mix_int16(mic, system, out):
+    """Смешивает два сигнала int16 одинаковой длины в out с ограничением диапазона"""
+    if numba_available:
+        _mix_int16_numba(mic, system, out)
+    else:
+        # Складываем в int32, чтобы сумма int16 не переполнялась, и ограничиваем на месте
+        mixed = np.add(mic, system, dtype=np.int32)
+        np.clip(mixed, -32768, 32767, out=mixed)
+        out[:] = mixed
+    return out
+
+# Время (сек), в течение которого используется сохраненный список аудиоустройств
+DEVICES_CACHE_TTL = 10.0
+
+_devices_cache = None
+_devices_cache_time = 0.0
+_devices_cache_lock = threading.Lock()
+
+def query_audio_devices(refresh=False):
+    """Возвращает список аудиоустройств, кэшируя его на DEVICES_CACHE_TTL секунд"""
+    global _devices_cache, _devices_cache_time
+    
+    with _devices_cache_lock:
+        now = time.monotonic()
+        if refresh or _devices_cache is None or now - _devices_cache_time > DEVICES_CACHE_TTL:
+            _devices_cache = sd.query_devices()
+            _devices_cache_time = now
+        return _devices_cache
+
+# Записи больше этого размера (байт) после сохранения вытесняются из страничного кэша
+DROP_CACHE_MIN_BYTES = 64 << 20
+
+def drop_file_cache(path):
+    """Сбрасывает большой файл на диск и просит ОС не держать его в кэше (только Linux/POSIX)"""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        if os.path.getsize(path) < DROP_CACHE_MIN_BYTES:
+            return
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            # Грязные страницы DONTNEED не вытесняет, поэтому сначала дожидаемся записи на диск
+            os.fdatasync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        print(f"Не удалось освободить кэш файла {path}: {e}")
 
 class SystemAudioRecorder:
     """Класс для записи системного звука (включая голос собеседника) и микрофона"""
     
+    # Размер блока записи в сэмплах
+    CHUNK_SIZE = 1024
+    
+    # Начальный размер буфера записи (сек), если длительность не задана
+    INITIAL_BUFFER_SECONDS = 60
+    
+    # Сколько сэмплов смешивается за один проход при сохранении (~16 сек при 16 кГц)
+    MIX_BLOCK_SAMPLES = 256 * 1024
+    
+    # Названия устройств, которые обычно используются в Windows для записи системного звука
+    SYSTEM_DEVICE_RE = re.compile(r'stereo mix|what u hear|wasapi|loopback|мониторинг', re.IGNORECASE)
+    
     def __init__(self, sample_rate=16000, channels=1):
         self.sample_rate = sample_rate
         self.channels = channels
-        self.temp_dir = tempfile.mkdtemp()
+        self._temp_dir = None  # Создается по требованию, см. temp_dir
         self.recording = False
         self.is_windows = platform.system() == 'Windows'
         self.recording_thread = None
+        self.stop_event = threading.Event()
         self.audio_data = None
         self.system_audio_device = None
         self.mic_audio_device = None
     
+    @property
+    def temp_dir(self):
+        """Временная директория для записей, создается при первом обращении"""
+        if self._temp_dir is None:
+            self._temp_dir = tempfile.mkdtemp(prefix="memoai_")
+        return self._temp_dir
+    
+    def cleanup(self):
+        """Удаляет временную директорию с записями"""
+        if self._temp_dir is not None:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+            self._temp_dir = None
+    
     def list_audio_devices(self):
         """Получает список всех доступных аудиоустройств"""
-        p = pyaudio.PyAudio()
         devices = []
+        system_device = None
+        default_mic = None
         
-        # Перебираем все устройства
+        # Перебираем все устройства за один проход
         info = "\nДоступные аудиоустройства:\n"
-        for i in range(p.get_device_count()):
-            dev_info = p.get_device_info_by_index(i)
-            name = dev_info.get('name')
-            max_input_channels = dev_info.get('maxInputChannels')
-            max_output_channels = dev_info.get('maxOutputChannels')
+        for i, dev_info in enumerate(query_audio_devices()):
+            name = dev_info['name']
+            max_input_channels = dev_info['max_input_channels']
+            max_output_channels = dev_info['max_output_channels']
             
             device_type = []
             if max_input_channels > 0:
@@ -47,35 +158,27 @@ class SystemAudioRecorder:
             device_type_str = ", ".join(device_type)
             info += f"[{i}] {name} ({device_type_str})\n"
             
-            devices.append({
+            # В Windows отмечаем входные устройства, пригодные для записи системного звука
+            is_system = (self.is_windows and max_input_channels > 0
+                         and self.SYSTEM_DEVICE_RE.search(name) is not None)
+            
+            device = {
                 'index': i,
                 'name': name,
                 'input_channels': max_input_channels,
                 'output_channels': max_output_channels,
-                'type': device_type
-            })
-        
-        # Ищем устройство для системного звука
-        system_device = None
-        if self.is_windows:
-            # В Windows ищем устройства с названиями, которые обычно используются для системного звука
-            system_keywords = ['stereo mix', 'what u hear', 'wasapi', 'loopback', 'мониторинг']
-            for device in devices:
-                # Преобразуем название в нижний регистр для удобства поиска
-                name_lower = device['name'].lower()
-                if any(keyword in name_lower for keyword in system_keywords) and 'input' in device['type']:
-                    system_device = device
-                    break
-        
-        # Определяем устройство по умолчанию для микрофона
-        default_mic = None
-        for device in devices:
-            if device['input_channels'] > 0:
-                # Берем первое устройство с входными каналами (микрофон)
+                'type': device_type,
+                'is_system': is_system
+            }
+            devices.append(device)
+            
+            # Запоминаем первое устройство для системного звука
+            if is_system and system_device is None:
+                system_device = device
+            
+            # Микрофон по умолчанию - первое устройство с входными каналами
+            if max_input_channels > 0 and default_mic is None:
                 default_mic = device
-                break
-        
-        p.terminate()
         
         # Выводим информацию о рекомендуемых устройствах
         if system_device:
@@ -102,24 +205,24 @@ class SystemAudioRecorder:
             return False
         
         try:
+            # pycaw и comtypes есть только на Windows, поэтому импортируем их здесь
+            from comtypes import CLSCTX_ALL
+            from pycaw.pycaw import AudioUtilities, IAudioEndpointVolume
+            
             devices = AudioUtilities.GetSpeakers()
             interface = devices.Activate(IAudioEndpointVolume._iid_, CLSCTX_ALL, None)
             volume = interface.QueryInterface(IAudioEndpointVolume)
             
             # Проверяем, есть ли Stereo Mix
             # Примечание: это упрощенная версия, которая может не работать на всех системах
-            p = pyaudio.PyAudio()
             found = False
             
-            for i in range(p.get_device_count()):
-                dev = p.get_device_info_by_index(i)
-                if 'stereo mix' in dev['name'].lower() and dev['maxInputChannels'] > 0:
+            for dev in query_audio_devices():
+                if 'stereo mix' in dev['name'].lower() and dev['max_input_channels'] > 0:
                     found = True
                     print(f"Найден Stereo Mix: {dev['name']}")
                     break
             
-            p.terminate()
-            
             if not found:
                 print("Stereo Mix не найден или отключен в вашей системе.")
                 print("Инструкция для включения:")
@@ -164,6 +267,7 @@ class SystemAudioRecorder:
             
             # Запускаем запись в отдельном потоке
             self.recording = True
+            self.stop_event.clear()
             self.recording_thread = threading.Thread(target=self._record_audio, args=(duration,))
             self.recording_thread.daemon = True
             self.recording_thread.start()
@@ -184,6 +288,7 @@ class SystemAudioRecorder:
             return None
         
         self.recording = False
+        self.stop_event.set()
         
         # Ждем завершения потока записи
         if self.recording_thread and self.recording_thread.is_alive():
@@ -198,72 +303,83 @@ class SystemAudioRecorder:
     def _record_audio(self, duration=None):
         """Внутренний метод для записи аудио"""
         try:
-            p = pyaudio.PyAudio()
+            # Буферы int16 для хранения данных выделяем заранее: при известной длительности
+            # сразу под всю запись, иначе - на INITIAL_BUFFER_SECONDS с удвоением при нехватке
+            seconds = duration + 1 if duration else self.INITIAL_BUFFER_SECONDS
+            capacity = int(seconds * self.sample_rate) * self.channels
+            buffers = {}
+            counts = {}
+            
+            def make_callback(source):
+                """Создает callback PortAudio, копирующий блоки в буфер источника"""
+                buffers[source] = np.empty(capacity, dtype=np.int16)
+                counts[source] = 0
+                
+                def callback(indata, frame_count, time_info, status):
+                    if status:
+                        print(f"Статус записи ({source}): {status}")
+                    samples = np.frombuffer(indata, dtype=np.int16)
+                    start = counts[source]
+                    end = start + samples.size
+                    buffer = buffers[source]
+                    # Увеличиваем буфер вдвое, если заготовленное место закончилось
+                    if end > buffer.size:
+                        grown = np.empty(max(end, buffer.size * 2), dtype=np.int16)
+                        grown[:start] = buffer[:start]
+                        buffer = buffers[source] = grown
+                    buffer[start:end] = samples
+                    counts[source] = end
+                
+                return callback
             
-            # Открываем поток для микрофона
-            mic_stream = p.open(
-                format=pyaudio.paInt16,
+            # Открываем поток для микрофона. Данные забирает поток PortAudio через callback,
+            # поэтому в Python нет блокирующего цикла чтения
+            mic_stream = sd.RawInputStream(
+                samplerate=self.sample_rate,
                 channels=self.channels,
-                rate=self.sample_rate,
-                input=True,
-                frames_per_buffer=1024,
-                input_device_index=self.mic_audio_device
+                dtype='int16',
+                blocksize=self.CHUNK_SIZE,
+                device=self.mic_audio_device,
+                callback=make_callback('mic')
             )
             
             # Открываем поток для системного звука, если он доступен
             system_stream = None
             if self.system_audio_device is not None:
                 try:
-                    system_stream = p.open(
-                        format=pyaudio.paInt16,
+                    system_stream = sd.RawInputStream(
+                        samplerate=self.sample_rate,
                         channels=self.channels,
-                        rate=self.sample_rate,
-                        input=True,
-                        frames_per_buffer=1024,
-                        input_device_index=self.system_audio_device
+                        dtype='int16',
+                        blocksize=self.CHUNK_SIZE,
+                        device=self.system_audio_device,
+                        callback=make_callback('system')
                     )
                 except Exception as e:
                     print(f"Не удалось открыть системный звук: {e}")
             
-            # Буферы для хранения данных
-            mic_frames = []
-            system_frames = []
-            
-            start_time = time.time()
-            
-            # Записываем до тех пор, пока не установлен self.recording = False
+            # Записываем до тех пор, пока не будет вызван stop_recording
             # или не истечет duration (если задан)
             print("Идет запись...")
+            mic_stream.start()
+            if system_stream:
+                system_stream.start()
             
-            while self.recording:
-                # Проверяем, не истекло ли время записи
-                if duration and (time.time() - start_time) > duration:
-                    self.recording = False
-                    break
-                
-                # Читаем данные с микрофона
-                mic_data = mic_stream.read(1024, exception_on_overflow=False)
-                mic_frames.append(mic_data)
-                
-                # Читаем данные с системного звука, если он доступен
-                if system_stream:
-                    system_data = system_stream.read(1024, exception_on_overflow=False)
-                    system_frames.append(system_data)
+            self.stop_event.wait(duration)
+            self.recording = False
             
             # Закрываем потоки
-            mic_stream.stop_stream()
+            mic_stream.stop()
             mic_stream.close()
             
             if system_stream:
-                system_stream.stop_stream()
+                system_stream.stop()
                 system_stream.close()
             
-            p.terminate()
-            
             # Сохраняем данные для последующей обработки
             self.audio_data = {
-                'mic': mic_frames,
-                'system': system_frames if system_stream else None
+                'mic': buffers['mic'][:counts['mic']],
+                'system': buffers['system'][:counts['system']] if system_stream else None
             }
             
         except Exception as e:
@@ -280,39 +396,41 @@ class SystemAudioRecorder:
             # Создаем имя выходного файла
             output_file = os.path.join(self.temp_dir, f"meeting_recording_{int(time.time())}.wav")
             
-            # Проверяем наличие данных системного звука
-            if self.audio_data['system']:
-                # Если есть системный звук, смешиваем его с микрофоном
-                # Преобразуем байтовые данные в numpy массивы
-                mic_data = np.frombuffer(b''.join(self.audio_data['mic']), dtype=np.int16)
-                system_data = np.frombuffer(b''.join(self.audio_data['system']), dtype=np.int16)
+            with wave.open(output_file, 'wb') as wf:
+                wf.setnchannels(self.channels)
+                wf.setsampwidth(2)  # 16 бит = 2 байта
+                wf.setframerate(self.sample_rate)
                 
-                # Обрезаем массивы до одинаковой длины
-                min_length = min(len(mic_data), len(system_data))
-                mic_data = mic_data[:min_length]
-                system_data = system_data[:min_length]
+                mic_data = self.audio_data['mic']
+                system_data = self.audio_data['system']
                 
-                # Смешиваем микрофон и системный звук (50/50)
-                # Микшируем, избегая переполнения
-                mixed_data = np.clip(mic_data + system_data, -32768, 32767).astype(np.int16)
-                
-                # Сохраняем микшированные данные в файл
-                with wave.open(output_file, 'wb') as wf:
-                    wf.setnchannels(self.channels)
-                    wf.setsampwidth(2)  # 16 бит = 2 байта
-                    wf.setframerate(self.sample_rate)
-                    wf.writeframes(mixed_data.tobytes())
-            else:
-                # Если нет системного звука, сохраняем только микрофон
-                with wave.open(output_file, 'wb') as wf:
-                    wf.setnchannels(self.channels)
-                    wf.setsampwidth(2)  # 16 бит = 2 байта
-                    wf.setframerate(self.sample_rate)
-                    wf.writeframes(b''.join(self.audio_data['mic']))
+                # Проверяем наличие данных системного звука
+                if system_data is not None and system_data.size:
+                    # Если есть системный звук, смешиваем его с микрофоном блоками по
+                    # MIX_BLOCK_SAMPLES сэмплов в переиспользуемый буфер
+                    common_length = min(mic_data.size, system_data.size)
+                    mixed = np.empty(min(common_length, self.MIX_BLOCK_SAMPLES), dtype=np.int16)
+                    
+                    for start in range(0, common_length, self.MIX_BLOCK_SAMPLES):
+                        end = min(start + self.MIX_BLOCK_SAMPLES, common_length)
+                        # Смешиваем микрофон и системный звук (50/50)
+                        wf.writeframes(mix_int16(mic_data[start:end], system_data[start:end],
+                                                 mixed[:end - start]))
+                    
+                    # Потоки пишутся независимо, поэтому один может оказаться длиннее на
+                    # несколько блоков - его хвост сохраняем как есть (смешивание с тишиной)
+                    longer_data = mic_data if mic_data.size > common_length else system_data
+                    wf.writeframes(longer_data[common_length:])
+                else:
+                    # Если нет системного звука, сохраняем только микрофон
+                    wf.writeframes(mic_data)
             
             # Очищаем данные после сохранения
             self.audio_data = None
             
+            # Длинная запись не должна вытеснять из кэша модель распознавания
+            drop_file_cache(output_file)
+            
             return output_file
             
         except Exception as e:
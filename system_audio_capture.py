@@ -1,40 +1,114 @@
 import os
+import math
+import shutil
 import tempfile
 import time
 import wave
 import numpy as np
 import threading
 import platform
-import pyaudio
-import comtypes
-from comtypes import CLSCTX_ALL
-from pycaw.pycaw import AudioUtilities, IAudioEndpointVolume
+import sounddevice as sd
+from system_audio import query_audio_devices, drop_file_cache, rms_int16
+
+# scipy (если установлена) позволяет передискретизировать loopback-запись без ffmpeg
+try:
+    from scipy import signal
+    scipy_available = True
+except ImportError:
+    scipy_available = False
+
+# Numba (если установлена) ускоряет сведение многоканального звука в моно
+try:
+    from numba import njit
+    numba_available = True
+except ImportError:
+    numba_available = False
+
+if numba_available:
+    @njit(fastmath=True, cache=True)
+    def _downmix_int16_numba(src, dst, channels):
+        """Усредняет каналы int16 в целочисленной арифметике без перехода к float"""
+        for i in range(dst.shape[0]):
+            acc = 0
+            for c in range(channels):
+                acc += src[i * channels + c]
+            dst[i] = acc // channels
+    
+    # Компилируем при импорте (для read-only буфера, как в callback), а не в первом callback записи
+    _downmix_int16_numba(np.frombuffer(bytes(8), dtype=np.int16), np.empty(2, dtype=np.int16), 2)
+
+def downmix_int16(src, dst, channels):
+    """Сводит чередующиеся каналы int16 из src в моно в dst"""
+    if numba_available:
+        _downmix_int16_numba(src, dst, channels)
+    else:
+        frames = src.reshape(-1, channels)
+        np.floor_divide(frames.sum(axis=1, dtype=np.int32), channels, out=dst, casting='unsafe')
 
 class WasapiLoopbackCapture:
     """Класс для записи системного звука через WASAPI loopback режим без необходимости Stereo Mix"""
     
+    # Сколько сэмплов передается в writeframes за один вызов (1 МиБ): блок больше буфера файла,
+    # поэтому пишется прямо из буфера записи без промежуточного копирования
+    WRITE_BLOCK_SAMPLES = 1 << 19
+    
+    # Начальный размер буфера записи (секунд)
+    INITIAL_BUFFER_SECONDS = 60
+    
+    # Если после длинной записи буфер вырос больше этого размера (байт), после сохранения
+    # он возвращается к начальному, чтобы не держать память между короткими записями
+    MAX_IDLE_BUFFER_BYTES = 16 << 20
+    
     def __init__(self, sample_rate=16000, channels=1, chunk_size=1024):
         self.sample_rate = sample_rate
         self.channels = channels
         self.chunk_size = chunk_size
-        self.temp_dir = tempfile.mkdtemp()
+        self._temp_dir = None  # Создается по требованию, см. temp_dir
         self.recording = False
         self.recording_thread = None
-        self.frames = []
+        self.stop_event = threading.Event()
+        # Фактический формат захвата: при WASAPI loopback совпадает с форматом устройства вывода
+        self.capture_rate = sample_rate
+        self.capture_channels = channels
+        # Рассчитанные фильтры передискретизации по паре (up, down)
+        self.resample_filters = {}
+        # Записанные сэмплы int16 хранятся в одном заранее выделенном буфере, который
+        # переиспользуется между записями и при нехватке места увеличивается вдвое
+        self.buffer = self._allocate_buffer()
+        self.buffer_pos = 0
+        # Защищает buffer и buffer_pos: callback PortAudio может заменить буфер на больший,
+        # пока другой поток читает уровень сигнала
+        self.buffer_lock = threading.Lock()
         
+    def _allocate_buffer(self):
+        """Выделяет буфер записи начального размера"""
+        return np.empty(self.sample_rate * self.INITIAL_BUFFER_SECONDS * self.channels, dtype=np.int16)
+    
+    @property
+    def temp_dir(self):
+        """Временная директория для записей, создается при первом обращении"""
+        if self._temp_dir is None:
+            self._temp_dir = tempfile.mkdtemp(prefix="memoai_")
+        return self._temp_dir
+    
+    def cleanup(self):
+        """Удаляет временную директорию с записями"""
+        if self._temp_dir is not None:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+            self._temp_dir = None
+    
     def list_devices(self):
         """Выводит список доступных аудиоустройств"""
-        p = pyaudio.PyAudio()
         info = "\nДоступные аудиоустройства:\n"
         
         # Ищем WASAPI loopback устройства
         loopback_devices = []
         
-        for i in range(p.get_device_count()):
-            dev_info = p.get_device_info_by_index(i)
-            name = dev_info.get('name')
-            max_input_channels = dev_info.get('maxInputChannels')
-            max_output_channels = dev_info.get('maxOutputChannels')
+        # Один общий снимок списка устройств (кэшируется на DEVICES_CACHE_TTL секунд)
+        for i, dev_info in enumerate(query_audio_devices()):
+            name = dev_info['name']
+            max_input_channels = dev_info['max_input_channels']
+            max_output_channels = dev_info['max_output_channels']
             
             device_type = []
             if max_input_channels > 0:
@@ -53,8 +127,6 @@ class WasapiLoopbackCapture:
                     'is_loopback': "loopback" in name.lower() or "wasapi" in name.lower()
                 })
         
-        p.terminate()
-        
         # Выводим потенциальные устройства для записи системного звука
         if loopback_devices:
             info += "\nПотенциальные устройства для записи системного звука:\n"
@@ -78,8 +150,9 @@ class WasapiLoopbackCapture:
             print(f"Используется устройство по умолчанию (индекс {device_index})")
         
         try:
-            self.frames = []
+            self.buffer_pos = 0
             self.recording = True
+            self.stop_event.clear()
             self.recording_thread = threading.Thread(target=self._record_audio, args=(device_index, duration))
             self.recording_thread.daemon = True
             self.recording_thread.start()
@@ -98,6 +171,7 @@ class WasapiLoopbackCapture:
             return None
         
         self.recording = False
+        self.stop_event.set()
         
         # Ждем завершения потока записи
         if self.recording_thread and self.recording_thread.is_alive():
@@ -112,51 +186,127 @@ class WasapiLoopbackCapture:
     def _record_audio(self, device_index, duration=None):
         """Внутренний метод для записи аудио"""
         try:
-            p = pyaudio.PyAudio()
+            # Для устройства вывода WASAPI включаем loopback: захватываем уже смикшированный
+            # звук устройства в его родном формате (частота и число каналов устройства)
+            loopback_settings = self._loopback_settings(device_index)
+            if loopback_settings is not None:
+                device = query_audio_devices()[device_index]
+                self.capture_rate = int(device['default_samplerate'])
+                self.capture_channels = max(1, min(2, device['max_output_channels']))
+                print(f"WASAPI loopback: {self.capture_rate} Гц, каналов: {self.capture_channels}")
+            else:
+                self.capture_rate = self.sample_rate
+                self.capture_channels = self.channels
             
-            # Открываем поток для записи системного звука
-            # Примечание: для WASAPI loopback важно использовать host_api_specific_stream_info
-            # но это требует дополнительных настроек и проверки совместимости
-            # Пока используем обычный подход
-            stream = p.open(
-                format=pyaudio.paInt16,
-                channels=self.channels,
-                rate=self.sample_rate,
-                input=True,
-                frames_per_buffer=self.chunk_size,
-                input_device_index=device_index
+            # Открываем поток для записи системного звука. Данные забирает поток PortAudio
+            # через callback, поэтому в Python нет блокирующего цикла чтения
+            stream = sd.RawInputStream(
+                samplerate=self.capture_rate,
+                channels=self.capture_channels,
+                dtype='int16',
+                blocksize=self.chunk_size,
+                device=device_index,
+                extra_settings=loopback_settings,
+                callback=self._audio_callback
             )
             
             start_time = time.time()
             print("Идет запись...")
             
-            while self.recording:
-                # Проверяем, не истекло ли время записи
-                if duration and (time.time() - start_time) > duration:
-                    self.recording = False
-                    break
-                
-                # Читаем данные
-                data = stream.read(self.chunk_size, exception_on_overflow=False)
-                self.frames.append(data)
-                
-                # Каждые секунду выводим сообщение (необязательно)
-                current_duration = int(time.time() - start_time)
-                if duration and current_duration % 1 == 0:
-                    print(f"Идет запись: {current_duration}/{duration} сек...", end="\r")
-            
-            # Закрываем поток
-            stream.stop_stream()
-            stream.close()
-            p.terminate()
+            with stream:
+                # Ждем остановки записи или истечения duration, раз в секунду выводя прогресс
+                while True:
+                    timeout = 1
+                    if duration:
+                        timeout = min(timeout, start_time + duration - time.time())
+                        if timeout <= 0:
+                            self.recording = False
+                            break
+                    
+                    if self.stop_event.wait(timeout):
+                        break
+                    
+                    elapsed = int(time.time() - start_time)
+                    progress = f"{elapsed}/{duration}" if duration else f"{elapsed}"
+                    print(f"Идет запись: {progress} сек, "
+                          f"уровень: {self.signal_level():.0f} дБ...", end="\r")
             
         except Exception as e:
             print(f"Ошибка при записи: {e}")
             self.recording = False
     
+    def signal_level(self, seconds=1):
+        """Уровень сигнала за последние seconds секунд записи в дБ относительно полной шкалы"""
+        with self.buffer_lock:
+            count = min(self.buffer_pos, int(self.capture_rate * seconds))
+            rms = rms_int16(self.buffer[self.buffer_pos - count:self.buffer_pos])
+        return 20 * math.log10(max(rms, 1.0) / 32768)
+    
+    def _loopback_settings(self, device_index):
+        """Возвращает настройки WASAPI loopback, если устройство - выход WASAPI, иначе None"""
+        if platform.system() != 'Windows' or device_index is None:
+            return None
+        
+        try:
+            device = query_audio_devices()[device_index]
+            hostapi = sd.query_hostapis(device['hostapi'])
+            if 'WASAPI' not in hostapi['name'] or device['max_output_channels'] == 0:
+                return None
+            return sd.WasapiSettings(loopback=True)
+        except TypeError:
+            print("Установленная версия sounddevice не поддерживает WASAPI loopback")
+        except Exception as e:
+            print(f"Не удалось включить WASAPI loopback: {e}")
+        return None
+    
+    def _audio_callback(self, indata, frames, time_info, status):
+        """Callback PortAudio: копирует полученный блок в буфер записи"""
+        if status:
+            print(f"Статус записи: {status}")
+        samples = np.frombuffer(indata, dtype=np.int16)
+        with self.buffer_lock:
+            if self.capture_channels > self.channels:
+                # Loopback отдает стерео - сводим в моно (Vosk работает только с моно) прямо в буфер записи
+                end = self._reserve(samples.size // self.capture_channels)
+                downmix_int16(samples, self.buffer[self.buffer_pos:end], self.capture_channels)
+                self.buffer_pos = end
+            else:
+                self._append_samples(samples)
+    
+    def _reserve(self, count):
+        """Гарантирует место под count сэмплов, увеличивая буфер вдвое при нехватке; возвращает новый конец"""
+        end = self.buffer_pos + count
+        if end > self.buffer.size:
+            grown = np.empty(max(end, self.buffer.size * 2), dtype=np.int16)
+            grown[:self.buffer_pos] = self.buffer[:self.buffer_pos]
+            self.buffer = grown
+        return end
+    
+    def _append_samples(self, samples):
+        """Дописывает сэмплы в буфер записи"""
+        end = self._reserve(samples.size)
+        self.buffer[self.buffer_pos:end] = samples
+        self.buffer_pos = end
+    
+    def _resample(self, samples):
+        """Приводит запись к частоте sample_rate полифазным фильтром scipy"""
+        divisor = math.gcd(self.capture_rate, self.sample_rate)
+        up = self.sample_rate // divisor
+        down = self.capture_rate // divisor
+        
+        # Фильтр для пары частот рассчитываем один раз (те же параметры, что у resample_poly по умолчанию)
+        fir = self.resample_filters.get((up, down))
+        if fir is None:
+            max_rate = max(up, down)
+            fir = signal.firwin(20 * max_rate + 1, 1.0 / max_rate, window=('kaiser', 5.0))
+            self.resample_filters[(up, down)] = fir
+        
+        resampled = signal.resample_poly(samples.astype(np.float32), up, down, window=fir)
+        return np.clip(resampled, -32768, 32767).astype(np.int16)
+    
     def _save_recording(self):
         """Сохраняет записанные данные в файл"""
-        if not self.frames:
+        if not self.buffer_pos:
             print("Нет данных для сохранения")
             return None
         
@@ -164,15 +314,34 @@ class WasapiLoopbackCapture:
             # Создаем имя выходного файла
             output_file = os.path.join(self.temp_dir, f"system_audio_{int(time.time())}.wav")
             
-            # Сохраняем данные в файл
-            with wave.open(output_file, 'wb') as wf:
+            samples = self.buffer[:self.buffer_pos]
+            rate = self.capture_rate
+            
+            # Loopback пишет с частотой устройства - сразу приводим запись к нужной частоте,
+            # чтобы при транскрибации не требовалась отдельная конвертация через ffmpeg
+            if rate != self.sample_rate and scipy_available:
+                samples = self._resample(samples)
+                rate = self.sample_rate
+            
+            # Сохраняем данные блоками по WRITE_BLOCK_SAMPLES: блоки больше буфера файла проходят
+            # мимо него без лишней копии, а мелкие записи заголовка wave собираются в буфере
+            with open(output_file, 'wb') as f, wave.open(f, 'wb') as wf:
                 wf.setnchannels(self.channels)
                 wf.setsampwidth(2)  # 16 бит = 2 байта
-                wf.setframerate(self.sample_rate)
-                wf.writeframes(b''.join(self.frames))
+                wf.setframerate(rate)
+                for start in range(0, samples.size, self.WRITE_BLOCK_SAMPLES):
+                    end = min(start + self.WRITE_BLOCK_SAMPLES, samples.size)
+                    wf.writeframes(samples[start:end])
+            
+            # Очищаем буфер после сохранения (память остается выделенной для следующей записи),
+            # но слишком разросшийся после длинной записи буфер возвращаем к начальному размеру
+            with self.buffer_lock:
+                self.buffer_pos = 0
+                if self.buffer.nbytes > self.MAX_IDLE_BUFFER_BYTES:
+                    self.buffer = self._allocate_buffer()
             
-            # Очищаем буфер после сохранения
-            self.frames = []
+            # Длинная запись не должна вытеснять из кэша модель распознавания
+            drop_file_cache(output_file)
             
             return output_file
             
@@ -4,24 +4,255 @@ import subprocess
 from vosk import Model, KaldiRecognizer
 import wave
 import json
-import pytubefix
-from moviepy.editor import VideoFileClip
 import numpy as np
-import sounddevice as sd
 import soundfile as sf
 import time
+import random
 import requests
 import zipfile
 import shutil
 from tqdm import tqdm
 import re
 import sys
+import math
+import mmap
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+# fcntl есть только на POSIX системах
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# orjson (если установлен) разбирает результаты распознавания быстрее стандартного json
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# scipy (если установлена) дает качественную полифазную передискретизацию
+try:
+    from scipy import signal
+    scipy_available = True
+except ImportError:
+    scipy_available = False
+
+# Numba (если установлена) ускоряет простую передискретизацию, когда нет scipy
+try:
+    from numba import njit, prange
+    numba_available = True
+except ImportError:
+    numba_available = False
+
+if numba_available:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _linear_resample_numba(src, out):
+        """Линейная интерполяция src на равномерную сетку длины out.size"""
+        last = src.shape[0] - 1
+        step = last / (out.shape[0] - 1) if out.shape[0] > 1 else 0.0
+        for i in prange(out.shape[0]):
+            x = i * step
+            k = int(x)
+            if k >= last:
+                out[i] = src[last]
+            else:
+                t = x - k
+                out[i] = src[k] * (1 - t) + src[k + 1] * t
+
+def linear_resample(data, src_rate, dst_rate):
+    """Передискретизирует моно сигнал линейной интерполяцией (float32)"""
+    n_samples = int(len(data) * dst_rate / src_rate)
+    if numba_available and len(data) > 0:
+        out = np.empty(n_samples, dtype=np.float32)
+        _linear_resample_numba(np.ascontiguousarray(data, dtype=np.float32), out)
+        return out
+    return np.interp(
+        np.linspace(0, len(data) - 1, n_samples),
+        np.arange(len(data)),
+        data
+    ).astype(np.float32)
+
+def to_mono(data):
+    """Сводит многоканальный сигнал в моно float32 без промежуточного float64"""
+    if data.ndim < 2:
+        return data
+    if data.shape[1] == 2:
+        # Стерео (самый частый случай) - полусумма каналов одной векторной операцией
+        left = data[:, 0].astype(np.float32, copy=False)
+        right = data[:, 1].astype(np.float32, copy=False)
+        mono = np.add(left, right)
+        mono *= np.float32(0.5)
+        return mono
+    if data.shape[1] == 1:
+        return data[:, 0]
+    return data.mean(axis=1, dtype=np.float32)
+
+# yt-dlp (если установлен) позволяет получать с YouTube только аудиодорожку
+try:
+    import yt_dlp
+    yt_dlp_available = True
+except ImportError:
+    yt_dlp_available = False
+
+# httpx (если установлен вместе с h2) позволяет вести все Range-запросы через одно HTTP/2 соединение
+try:
+    import httpx
+    httpx_available = True
+except ImportError:
+    httpx_available = False
+
+# PyAV (если установлен) позволяет декодировать и передискретизировать аудио прямо в процессе
+try:
+    import av
+    av_available = True
+except ImportError:
+    av_available = False
+
+# Расширения файлов, которые транскрибируются как аудио и как видео
+AUDIO_EXTENSIONS = frozenset({'.mp3', '.wav', '.m4a', '.aac', '.flac', '.ogg', '.opus'})
+VIDEO_EXTENSIONS = frozenset({'.mp4', '.avi', '.mov', '.mkv', '.webm'})
+
+# Сигнатуры начала файла для определения типа при незнакомом расширении
+AUDIO_SIGNATURES = (b'ID3', b'fLaC', b'OggS', b'\xff\xfb', b'\xff\xf3', b'\xff\xf2', b'\xff\xf1', b'\xff\xf9')
+VIDEO_SIGNATURES = (b'\x1aE\xdf\xa3',)  # Matroska / WebM
+
+def sniff_media_type(file_path):
+    """Определяет по первым байтам, аудио это или видео ('audio', 'video' или None)"""
+    try:
+        with open(file_path, 'rb') as f:
+            head = f.read(16)
+    except OSError:
+        return None
+    
+    if head[:4] == b'RIFF':
+        # RIFF используется и для WAV, и для AVI
+        if head[8:12] == b'WAVE':
+            return 'audio'
+        if head[8:12] == b'AVI ':
+            return 'video'
+        return None
+    if head[4:8] == b'ftyp':
+        # Контейнер MP4: аудио только для брендов M4A/M4B
+        return 'audio' if head[8:11] in (b'M4A', b'M4B') else 'video'
+    if head.startswith(AUDIO_SIGNATURES):
+        return 'audio'
+    if head.startswith(VIDEO_SIGNATURES):
+        return 'video'
+    return None
+
+def wav_data_range(buffer):
+    """Возвращает (начало, конец) блока данных "data" в содержимом WAV файла"""
+    pos = 12  # Пропускаем заголовок RIFF....WAVE
+    while pos + 8 <= len(buffer):
+        chunk_id = buffer[pos:pos + 4]
+        chunk_size = int.from_bytes(buffer[pos + 4:pos + 8], 'little')
+        if chunk_id == b'data':
+            return pos + 8, min(pos + 8 + chunk_size, len(buffer))
+        # Блоки RIFF выравниваются по четной границе
+        pos += 8 + chunk_size + (chunk_size & 1)
+    raise ValueError("В WAV файле не найден блок данных")
+
+# Поле "text" в результате Vosk - единственное, что нужно из JSON
+_RESULT_TEXT_RE = re.compile(r'"text"\s*:\s*"([^"]*)"')
+
+def _result_text(raw_result):
+    """Извлекает текст из JSON-результата Vosk без полного разбора JSON"""
+    match = _RESULT_TEXT_RE.search(raw_result)
+    if not match:
+        return ""
+    text = match.group(1)
+    if '\\' in text:
+        # Экранированные символы встречаются редко - в этом случае разбираем JSON целиком
+        return json_loads(raw_result).get("text", "")
+    return text
+
+# Шаблоны ссылок YouTube, компилируются один раз при загрузке модуля
+_YOUTUBE_URL_PATTERNS = (
+    re.compile(r'(https?://)?(www\.)?(youtube\.com|youtu\.be|youtube-nocookie\.com)'),
+    re.compile(r'(https?://)?(www\.)?m\.youtube\.com'),
+)
+_YOUTUBE_ID_RE = re.compile(r'^[a-zA-Z0-9_-]{11}$')
+_YOUTU_BE_RE = re.compile(r'youtu\.be/([a-zA-Z0-9_-]+)')
+_WATCH_ID_RE = re.compile(r'[?&]v=([a-zA-Z0-9_-]+)')
+_V_PATH_ID_RE = re.compile(r'/v/([a-zA-Z0-9_-]+)')
+_EMBED_ID_RE = re.compile(r'/embed/([a-zA-Z0-9_-]+)')
+
+class _ProgressReader:
+    """Обертка над потоком чтения, сообщающая о размере каждого прочитанного куска"""
+    
+    def __init__(self, raw, advance):
+        self.raw = raw
+        self.advance = advance
+    
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.advance(len(data))
+        return data
 
 class Transcriber:
+    # Загруженные модели Vosk, общие для всех экземпляров (ключ - путь к модели)
+    model_cache = {}
+    model_cache_lock = threading.Lock()
+    
+    # Размер блока, передаваемого в распознаватель (в сэмплах): 2 секунды при 16 кГц,
+    # кратно 10-мс кадру Kaldi (160 сэмплов), чтобы в распознавателе не оставалось обрезков
+    FEED_BLOCK_FRAMES = 32000
+    
+    # Размер блока, читаемого с микрофона (в сэмплах): 0.5 секунды при 16 кГц
+    MIC_BLOCK_FRAMES = 8000
+    
+    # Сколько секунд ждать очередной блок с микрофона, прежде чем считать поток оборванным
+    MIC_READ_TIMEOUT = 5
+    
+    # Сколько декодированных блоков может ждать распознавателя (ограничивает память)
+    PREFETCH_BLOCKS = 8
+    
+    # Размер буфера канала между ffmpeg и распознавателем (байт)
+    PIPE_BUFFER_SIZE = 1 << 20
+    
+    # Параметры потоков ffmpeg: 0 - число потоков декодера и фильтров выбирается автоматически
+    FFMPEG_THREAD_OPTIONS = ("-threads", "0", "-filter_threads", "0")
+    
+    # Минимальная длина сегмента (сек) при параллельном распознавании: на коротких файлах не окупается
+    MIN_SEGMENT_SECONDS = 60
+    
+    # Максимальное число потоков распознавания одного файла
+    MAX_DECODE_WORKERS = 8
+    
+    # Окно (сек) вокруг точки разреза, в котором ищется самая тихая пауза
+    SPLIT_SEARCH_SECONDS = 2
+    
+    # Число параллельных соединений при загрузке модели
+    DOWNLOAD_WORKERS = 8
+    
+    # Размер куска, читаемого из сети за один раз при загрузке (байт)
+    DOWNLOAD_CHUNK_SIZE = 1 << 20
+    
+    # Размер одного HTTP-запроса при загрузке через pytubefix (байт)
+    YOUTUBE_RANGE_SIZE = 10 << 20
+    
+    # Число попыток сетевых операций и предельная задержка между ними (сек)
+    RETRY_ATTEMPTS = 3
+    RETRY_MAX_DELAY = 30
+    
+    # Файл-метка в папке модели, создаваемый после полной распаковки
+    MODEL_READY_FILE = ".vosk_ready"
+    
+    # Файл-метка незавершенной автоматической распаковки модели
+    MODEL_PARTIAL_FILE = ".vosk_partial"
+    
+    # Минимальный интервал между вызовами callback'а прогресса (сек)
+    PROGRESS_INTERVAL = 0.25
+    
     def __init__(self):
         # Получаем абсолютный путь к директории проекта
         self.project_dir = os.path.abspath(os.path.dirname(os.path.abspath(__file__)))
         self.model = None
+        # Распознаватели для текущей модели, по одному на частоту дискретизации
+        self.recognizers = {}
         self.temp_dir = tempfile.mkdtemp()
         self.language = "ru"  # По умолчанию используем русский
         
@@ -38,11 +269,59 @@ class Transcriber:
         
         # Обратный вызов для обновления прогресса
         self.progress_callback = None
+        # Время последнего вызова callback'а прогресса (для ограничения частоты обновлений)
+        self.last_progress_time = 0.0
+        
+        # Загружаем модель в фоне, чтобы первая транскрибация не ждала ее загрузки.
+        # Если транскрибация начнется раньше, load_model дождется этой загрузки через кэш
+        self.preload_thread = None
+        if self.is_model_ready():
+            self.preload_thread = threading.Thread(
+                target=self._preload_model, args=(os.path.abspath(self.model_size),), daemon=True
+            )
+            self.preload_thread.start()
+        
+    def _preload_model(self, model_key):
+        """Фоновая загрузка модели model_key в кэш"""
+        try:
+            model = self._get_cached_model(model_key)
+        except Exception as e:
+            print(f"Ошибка при фоновой загрузке модели Vosk: {str(e)}")
+            return
         
+        # Пока модель грузилась, путь могли сменить (set_model_size) - тогда чужую модель не ставим
+        if self.model is None and os.path.abspath(self.model_size) == model_key:
+            self.model = model
+    
+    def _get_cached_model(self, model_key):
+        """Возвращает модель из кэша или загружает ее один раз на процесс"""
+        with Transcriber.model_cache_lock:
+            model = Transcriber.model_cache.get(model_key)
+            if model is None:
+                model = Model(model_key)
+                Transcriber.model_cache[model_key] = model
+                print("Модель Vosk успешно загружена")
+            else:
+                print("Модель Vosk взята из кэша")
+        return model
+    
+    def is_model_ready(self):
+        """Проверяет, что модель в model_size распакована полностью (по файлу-метке)"""
+        ready_file = os.path.join(self.model_size, self.MODEL_READY_FILE)
+        if os.path.isfile(ready_file):
+            return True
+        
+        # Модель, распакованная вручную, метки не имеет - признаем ее по файлу акустической модели,
+        # если только это не прерванная автоматическая распаковка
+        # (проверка только читает: метку пишет лишь download_vosk_model)
+        partial_file = os.path.join(self.model_size, self.MODEL_PARTIAL_FILE)
+        return (os.path.isfile(os.path.join(self.model_size, "am", "final.mdl"))
+                and not os.path.exists(partial_file))
+    
     def check_and_prepare_model(self):
         """Проверяет наличие модели Vosk и при необходимости загружает её"""
-        # Проверяем существование папки и наличие в ней файлов модели
-        if not os.path.exists(self.model_size) or not os.listdir(self.model_size):
+        # Проверяем, что модель полностью распакована
+        if not self.is_model_ready():
             print(f"Папка модели пуста или не существует: {self.model_size}")
             
             # Спрашиваем пользователя, хочет ли он загрузить модель
@@ -65,35 +344,42 @@ class Transcriber:
             
             print(f"Загрузка модели Vosk с {model_url}...")
             # Загружаем ZIP-архив
-            response = requests.get(model_url, stream=True)
-            total_size = int(response.headers.get('content-length', 0))
+            self._download_file(model_url, zip_path)
             
-            with open(zip_path, 'wb') as f:
-                for chunk in tqdm(response.iter_content(chunk_size=8192), total=total_size//8192, unit='KB'):
-                    if chunk:
-                        f.write(chunk)
+            # Пока архив распаковывается, модель считается неготовой
+            ready_file = os.path.join(self.model_size, self.MODEL_READY_FILE)
+            partial_file = os.path.join(self.model_size, self.MODEL_PARTIAL_FILE)
+            if os.path.exists(ready_file):
+                os.remove(ready_file)
+            open(partial_file, 'w').close()
             
             print("Распаковка архива с моделью...")
             # Распаковываем архив
             with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                # Извлекаем в временную папку
-                temp_extract = os.path.join(self.temp_dir, "extract")
-                if not os.path.exists(temp_extract):
-                    os.makedirs(temp_extract)
-                zip_ref.extractall(temp_extract)
-                
-                # Находим распакованную папку модели
-                extracted_folders = [f for f in os.listdir(temp_extract) if os.path.isdir(os.path.join(temp_extract, f))]
-                if extracted_folders:
-                    model_folder = os.path.join(temp_extract, extracted_folders[0])
-                    # Копируем содержимое в целевую папку model_small
-                    for item in os.listdir(model_folder):
-                        s = os.path.join(model_folder, item)
-                        d = os.path.join(self.model_size, item)
-                        if os.path.isdir(s):
-                            shutil.copytree(s, d)
-                        else:
-                            shutil.copy2(s, d)
+                # Распаковываем содержимое папки модели сразу в model_small, отбрасывая
+                # верхнюю папку архива - без промежуточной распаковки и копирования
+                model_root = os.path.abspath(self.model_size)
+                for member in zip_ref.infolist():
+                    parts = member.filename.split('/', 1)
+                    if len(parts) < 2 or not parts[1]:
+                        continue
+                    
+                    target = os.path.abspath(os.path.join(model_root, parts[1]))
+                    # Не даем элементам архива выйти за пределы папки модели
+                    if os.path.commonpath([model_root, target]) != model_root:
+                        continue
+                    
+                    if member.is_dir():
+                        os.makedirs(target, exist_ok=True)
+                        continue
+                    
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with zip_ref.open(member) as src, open(target, 'wb') as dst:
+                        shutil.copyfileobj(src, dst, 1 << 20)
+            
+            # Метка пишется только после успешной распаковки всех файлов
+            open(ready_file, 'w').close()
+            os.remove(partial_file)
             
             print(f"Модель Vosk успешно загружена и распакована в {self.model_size}")
             return True
@@ -101,6 +387,140 @@ class Transcriber:
             print(f"Ошибка при загрузке модели: {str(e)}")
             return False
         
+    def _download_file(self, url, path, total_size=None, on_progress=None, parallel=True):
+        """Загружает файл, по возможности несколькими параллельными Range-запросами
+        
+        Если размер файла известен заранее (total_size), HEAD-запрос не выполняется, а поддержка
+        Range проверяется по ответам сервера. on_progress(загружено, всего) вызывается по мере загрузки.
+        При parallel=False файл загружается одним потоком сразу на диск.
+        """
+        if total_size is None:
+            head = requests.head(url, allow_redirects=True, timeout=30)
+            total_size = int(head.headers.get('content-length', 0))
+            accepts_ranges = head.headers.get('accept-ranges', '').lower() == 'bytes'
+        else:
+            accepts_ranges = True
+        
+        with tqdm(total=total_size or None, unit='B', unit_scale=True) as progress:
+            progress_lock = threading.Lock()
+            downloaded = 0
+            
+            def advance(size):
+                nonlocal downloaded
+                with progress_lock:
+                    downloaded += size
+                    progress.update(size)
+                    if on_progress:
+                        on_progress(downloaded, total_size)
+            
+            if not parallel or not accepts_ranges or total_size < self.DOWNLOAD_WORKERS * self.DOWNLOAD_CHUNK_SIZE:
+                # Сервер не поддерживает Range (или файл небольшой) - загружаем одним потоком
+                response = requests.get(url, stream=True, timeout=30)
+                response.raise_for_status()
+                # Копируем сырой поток большими кусками без цикла по чанкам на Python
+                response.raw.decode_content = True
+                with open(path, 'wb') as f:
+                    shutil.copyfileobj(_ProgressReader(response.raw, advance), f, self.DOWNLOAD_CHUNK_SIZE)
+                return
+            
+            # Файл нужного размера создаем заранее, каждый поток пишет в него свой диапазон
+            with open(path, 'wb') as f:
+                f.truncate(total_size)
+            
+            part_size = -(-total_size // self.DOWNLOAD_WORKERS)
+            
+            def download_range(start):
+                end = min(start + part_size, total_size) - 1
+                response = requests.get(url, headers={'Range': f'bytes={start}-{end}'}, stream=True, timeout=30)
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise IOError("Сервер не вернул запрошенный диапазон")
+                
+                written = 0
+                with open(path, 'r+b') as f:
+                    f.seek(start)
+                    for chunk in response.iter_content(chunk_size=self.DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                        written += len(chunk)
+                        advance(len(chunk))
+                
+                if written != end - start + 1:
+                    raise IOError(f"Диапазон {start}-{end} загружен не полностью")
+            
+            with ThreadPoolExecutor(max_workers=self.DOWNLOAD_WORKERS) as executor:
+                futures = [executor.submit(download_range, start) for start in range(0, total_size, part_size)]
+                for future in futures:
+                    future.result()
+    
+    def _retry(self, action, description, fatal_errors=()):
+        """Выполняет action с повторами: экспоненциальная задержка со случайным разбросом
+        
+        Ошибки из fatal_errors не повторяются; после последней попытки ошибка пробрасывается.
+        """
+        for attempt in range(self.RETRY_ATTEMPTS):
+            try:
+                return action()
+            except fatal_errors:
+                raise
+            except Exception as e:
+                if attempt == self.RETRY_ATTEMPTS - 1:
+                    raise
+                print(f"{description}: ошибка (попытка {attempt+1}/{self.RETRY_ATTEMPTS}): {e}")
+                # 1, 2, 4... сек плюс разброс, чтобы повторные запросы не шли синхронно
+                time.sleep(min(self.RETRY_MAX_DELAY, 2 ** attempt + random.random()))
+    
+    def _download_ranges(self, url, path, total_size, on_progress=None):
+        """Параллельная Range-загрузка: через HTTP/2 (httpx), если он доступен, иначе через requests"""
+        if httpx_available and total_size:
+            try:
+                self._download_via_httpx(url, path, total_size, on_progress)
+                return
+            except Exception as h2_err:
+                print(f"Загрузка через HTTP/2 не удалась ({h2_err}), используем HTTP/1.1...")
+        self._download_file(url, path, total_size=total_size, on_progress=on_progress)
+    
+    def _download_via_httpx(self, url, path, total_size, on_progress=None):
+        """Загружает файл параллельными Range-запросами, мультиплексированными в одном HTTP/2 соединении
+        
+        В отличие от requests (HTTP/1.1, отдельное TCP+TLS соединение на каждый диапазон),
+        все диапазоны идут потоками одного соединения, без повторных рукопожатий.
+        """
+        with open(path, 'wb') as f:
+            f.truncate(total_size)
+        
+        part_size = -(-total_size // self.DOWNLOAD_WORKERS)
+        progress_lock = threading.Lock()
+        downloaded = 0
+        
+        limits = httpx.Limits(max_keepalive_connections=4)
+        with httpx.Client(http2=True, limits=limits, timeout=30, follow_redirects=True) as client:
+            def download_range(start):
+                nonlocal downloaded
+                end = min(start + part_size, total_size) - 1
+                written = 0
+                with client.stream('GET', url, headers={'Range': f'bytes={start}-{end}'}) as response:
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        raise IOError("Сервер не вернул запрошенный диапазон")
+                    
+                    with open(path, 'r+b') as f:
+                        f.seek(start)
+                        for chunk in response.iter_bytes(self.DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+                            written += len(chunk)
+                            with progress_lock:
+                                downloaded += len(chunk)
+                                if on_progress:
+                                    on_progress(downloaded, total_size)
+                
+                if written != end - start + 1:
+                    raise IOError(f"Диапазон {start}-{end} загружен не полностью")
+            
+            with ThreadPoolExecutor(max_workers=self.DOWNLOAD_WORKERS) as executor:
+                futures = [executor.submit(download_range, start) for start in range(0, total_size, part_size)]
+                for future in futures:
+                    future.result()
+    
     def _check_ffmpeg_availability(self):
         """Проверка доступности FFmpeg в системе"""
         try:
@@ -120,8 +540,8 @@ class Transcriber:
         try:
             print(f"Загрузка модели Vosk ({self.model_size})...")
             
-            # Проверяем, что директория модели существует и содержит файлы
-            if not os.path.exists(self.model_size) or not os.listdir(self.model_size):
+            # Проверяем, что модель полностью распакована
+            if not self.is_model_ready():
                 print(f"Директория модели пуста или не существует: {self.model_size}")
                 
                 # Пробуем автоматически загрузить модель
@@ -134,13 +554,12 @@ class Transcriber:
                     print("и распакуйте её в папку 'model_small' в корне проекта.")
                     return False
             
-            # Явно освобождаем предыдущую модель, если она была загружена
-            if self.model is not None:
-                self.model = None
+            # Распознаватели привязаны к предыдущей модели
+            self.recognizers.clear()
             
-            # Загружаем модель
-            self.model = Model(self.model_size)
-            print("Модель Vosk успешно загружена")
+            # Берем модель из кэша или загружаем ее один раз на процесс
+            # (ключ - абсолютный путь, чтобы относительный и полный путь давали одну запись)
+            self.model = self._get_cached_model(os.path.abspath(self.model_size))
             return True
         except Exception as e:
             print(f"Ошибка при загрузке модели Vosk: {str(e)}")
@@ -171,164 +590,419 @@ class Transcriber:
             if not os.path.exists(self.temp_dir):
                 os.makedirs(self.temp_dir, exist_ok=True)
             
-            # Преобразуем аудио в WAV 16кГц 16bit моно если нужно
-            wav_path = os.path.abspath(os.path.join(self.temp_dir, "audio_for_transcription.wav"))
+            # Проверяем формат входного файла по заголовку (без декодирования)
+            info = self._probe_audio(audio_path)
+            if info is not None and info.channels == 1 and info.samplerate == self.sample_rate:
+                self.update_progress(40)
+                if info.format == 'WAV' and info.subtype == 'PCM_16':
+                    # Если файл уже в нужном формате, используем его напрямую
+                    return self._transcribe_wav(audio_path)
+                # 16кГц моно в другом контейнере (FLAC, OGG...) - перекодирование не нужно,
+                # читаем сэмплы через soundfile прямо в распознаватель
+                return self._transcribe_with_soundfile(audio_path, info.frames)
             
-            # Проверяем формат входного файла
-            if self._is_wav_16khz_mono(audio_path):
-                # Если файл уже в нужном формате, используем его напрямую
-                wav_path = audio_path
+            if av_available:
+                # Декодируем и передискретизируем аудио прямо в процессе через PyAV:
+                # без запуска ffmpeg и без промежуточного WAV файла
                 self.update_progress(40)
-            else:
-                # Конвертируем файл в нужный формат
-                self.update_progress(35)
-                print("Преобразование аудио в нужный формат...")
-                if self.use_ffmpeg:
-                    success, wav_path = self._convert_with_ffmpeg(audio_path, wav_path)
-                    if not success:
-                        return False, wav_path
-                else:
-                    success, wav_path = self._convert_with_sounddevice(audio_path, wav_path)
-                    if not success:
-                        return False, wav_path
+                return self._transcribe_with_av(audio_path)
+            
+            if self.use_ffmpeg:
+                # Читаем PCM из stdout ffmpeg напрямую, без промежуточного WAV файла
                 self.update_progress(40)
+                return self._transcribe_with_ffmpeg_pipe(audio_path)
             
-            # Проверяем файл перед открытием
-            if not os.path.exists(wav_path):
-                return False, f"Ошибка: WAV файл не был создан: {wav_path}"
-                
-            try:
-                # Открываем WAV файл для распознавания
-                wf = wave.open(wav_path, "rb")
-                
-                # Проверяем параметры аудио
-                print(f"Параметры WAV файла: каналы={wf.getnchannels()}, частота={wf.getframerate()}, "
-                      f"сэмплов={wf.getnframes()}, длительность={wf.getnframes()/wf.getframerate():.2f} сек")
-                
-                # Создаем распознаватель с точным указанием параметров
-                rec = KaldiRecognizer(self.model, wf.getframerate())
-                
-                # Проверяем, что распознаватель создан успешно
-                if rec is None:
-                    return False, "Не удалось создать распознаватель Kaldi"
-                
-                # Собираем результаты транскрибации
-                result_text = []
-                
-                # Увеличиваем размер буфера для ускорения обработки (40000 сэмплов вместо 4000)
-                buffer_size = 40000
+            # Преобразуем аудио в PCM 16кГц 16bit моно
+            self.update_progress(35)
+            print("Преобразование аудио в нужный формат...")
+            success, pcm = self._convert_with_sounddevice(audio_path)
+            if not success:
+                return False, pcm
+            self.update_progress(40)
+            
+            # Сэмплы уже в памяти - отдаем их распознавателю без записи и повторного чтения WAV
+            return self._transcribe_pcm(pcm, 0, len(pcm) // 2, self.sample_rate)
+            
+        except Exception as e:
+            print(f"Ошибка при транскрибации аудио: {str(e)}")
+            return False, f"Ошибка при транскрибации: {str(e)}"
+    
+    def _transcribe_wav(self, wav_path):
+        """Распознает WAV файл в формате PCM 16 бит моно"""
+        try:
+            # Параметры аудио читаем из заголовка один раз
+            with wave.open(wav_path, "rb") as wf:
+                rate = wf.getframerate()
+                n_frames = wf.getnframes()
+                channels = wf.getnchannels()
+                sample_width = wf.getsampwidth()
+                print(f"Параметры WAV файла: каналы={channels}, частота={rate}, "
+                      f"сэмплов={n_frames}, длительность={n_frames/rate:.2f} сек")
+            
+            # Распознаватель принимает только 16 бит моно - иначе он молча прочитал бы мусор
+            if channels != 1 or sample_width != 2:
+                return False, f"Неподдерживаемый формат WAV: каналов={channels}, байт на сэмпл={sample_width}"
+            
+            # Сэмплы берем срезами из отображенного в память файла: без внутреннего буфера wave,
+            # а ОС подгружает страницы с опережением
+            with open(wav_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                data_start, data_end = wav_data_range(mm)
+                n_frames = min(n_frames, (data_end - data_start) // 2)
+                return self._transcribe_pcm(mm, data_start, n_frames, rate)
                 
-                # Читаем аудио по частям и распознаем
-                print("Обработка аудио...")
-                total_frames = wf.getnframes()
-                processed_frames = 0
+        except Exception as wav_err:
+            print(f"Ошибка при обработке WAV файла: {str(wav_err)}")
+            return False, f"Ошибка при обработке WAV файла: {str(wav_err)}"
+    
+    def _transcribe_pcm(self, buffer, data_start, n_frames, rate):
+        """Распознает n_frames сэмплов PCM 16 бит моно из буфера (mmap или bytes), начиная с data_start"""
+        # Длинную запись распознаем параллельно: Kaldi отпускает GIL на время декодирования
+        workers = self._decode_workers(n_frames, rate)
+        if workers > 1:
+            return self._transcribe_wav_parallel(buffer, data_start, n_frames, rate, workers)
+        
+        blocks = self._mmap_blocks(buffer, data_start, data_start + n_frames * 2)
+        return self._recognize_blocks(blocks, n_frames, rate)
+    
+    def _mmap_blocks(self, mm, start, end):
+        """Отдает байты mm[start:end] блоками по FEED_BLOCK_FRAMES сэмплов"""
+        block_bytes = self.FEED_BLOCK_FRAMES * 2
+        for pos in range(start, end, block_bytes):
+            yield mm[pos:min(pos + block_bytes, end)]
+    
+    def _decode_workers(self, n_frames, rate):
+        """Сколько потоков использовать для распознавания файла длиной n_frames сэмплов"""
+        max_by_length = n_frames // (self.MIN_SEGMENT_SECONDS * rate)
+        return max(1, min(os.cpu_count() or 1, self.MAX_DECODE_WORKERS, max_by_length))
+    
+    def _find_quiet_point(self, mm, data_start, n_frames, center, rate):
+        """Ищет рядом с center самый тихий 10-мс кадр, чтобы разрез не пришелся на слово"""
+        frame = rate // 100
+        radius = self.SPLIT_SEARCH_SECONDS * rate
+        start = max(0, center - radius)
+        count = min(2 * radius, n_frames - start) // frame
+        if count <= 0:
+            return center
+        window = np.frombuffer(mm, dtype=np.int16, count=count * frame, offset=data_start + start * 2)
+        energy = np.square(window.reshape(count, frame), dtype=np.float32).sum(axis=1)
+        return start + int(np.argmin(energy)) * frame
+    
+    def _transcribe_wav_parallel(self, mm, data_start, n_frames, rate, workers):
+        """Распознает длинный WAV по сегментам в нескольких потоках, разрезая запись на паузах"""
+        # Границы сегментов: равные части, сдвинутые к ближайшей паузе
+        bounds = [0]
+        for i in range(1, workers):
+            quiet_point = self._find_quiet_point(mm, data_start, n_frames, n_frames * i // workers, rate)
+            bounds.append(max(bounds[-1], quiet_point))
+        bounds.append(n_frames)
+        
+        print(f"Обработка аудио в {workers} потоках...")
+        self.update_progress(45)
+        
+        progress_lock = threading.Lock()
+        processed_frames = [0]
+        
+        def decode_segment(start, end):
+            # У каждого сегмента свой распознаватель, а отображение файла общее (только чтение)
+            rec = KaldiRecognizer(self.model, rate)
+            texts = []
+            for data in self._mmap_blocks(mm, data_start + start * 2, data_start + end * 2):
+                if rec.AcceptWaveform(data):
+                    text = _result_text(rec.Result())
+                    if text.strip():
+                        texts.append(text)
                 
-                # Устанавливаем начальный прогресс транскрибации
-                self.update_progress(45)
+                # Общий прогресс по всем потокам (от 45% до 95%)
+                with progress_lock:
+                    processed_frames[0] += len(data) // 2
+                    self.update_progress(45 + int(processed_frames[0] * 50 / n_frames))
+            
+            text = _result_text(rec.FinalResult())
+            if text.strip():
+                texts.append(text)
+            return texts
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(decode_segment, bounds[i], bounds[i + 1]) for i in range(workers)]
+            # Склеиваем результаты сегментов в исходном порядке
+            result_text = [text for future in futures for text in future.result()]
+        
+        return self._finish_transcript(result_text)
+    
+    def _transcribe_with_av(self, audio_path):
+        """Декодирует файл через PyAV в PCM 16кГц моно и сразу передает его в распознаватель"""
+        try:
+            with av.open(audio_path) as container:
+                if not container.streams.audio:
+                    return False, "В файле нет аудиодорожки"
                 
-                while True:
-                    data = wf.readframes(buffer_size)
-                    if len(data) == 0:
-                        break
-                    
-                    # Обновляем прогресс
-                    processed_frames += buffer_size
-                    progress = min(100, int(processed_frames * 100 / total_frames))
-                    
-                    # Рассчитываем общий прогресс (от 45% до 95%)
-                    total_progress = 45 + int(progress * 0.5)  # 50% диапазона для транскрибации
-                    self.update_progress(total_progress)
-                    
-                    if progress % 10 == 0:
-                        print(f"Прогресс транскрибации: {progress}%")
-                        
-                    # Отправляем данные в распознаватель
-                    if rec.AcceptWaveform(data):
-                        part_result = json.loads(rec.Result())
-                        if 'text' in part_result and part_result['text'].strip():
-                            result_text.append(part_result['text'])
+                stream = container.streams.audio[0]
                 
-                # Получаем финальный результат
-                part_result = json.loads(rec.FinalResult())
-                if 'text' in part_result and part_result['text'].strip():
-                    result_text.append(part_result['text'])
+                # Оцениваем количество сэмплов по длительности для отображения прогресса
+                if stream.duration is not None and stream.time_base is not None:
+                    duration = float(stream.duration * stream.time_base)
+                elif container.duration is not None:
+                    duration = container.duration / av.time_base
+                else:
+                    duration = 0
+                total_frames = int(duration * self.sample_rate)
+                print(f"Декодирование через PyAV: кодек={stream.codec_context.name}, длительность={duration:.2f} сек")
                 
-                # Закрываем файл
-                wf.close()
+                blocks = self._av_pcm_blocks(container, stream)
+                return self._recognize_blocks(self._prefetch_blocks(blocks), total_frames, self.sample_rate)
                 
-                full_text = " ".join(result_text)
+        except Exception as av_err:
+            print(f"Ошибка при декодировании через PyAV: {str(av_err)}")
+            return False, f"Ошибка при декодировании аудио: {str(av_err)}"
+    
+    def _av_pcm_blocks(self, container, stream):
+        """Декодирует аудиопоток PyAV в PCM 16 бит моно 16кГц блоками по FEED_BLOCK_FRAMES сэмплов"""
+        resampler = av.AudioResampler(format='s16', layout='mono', rate=self.sample_rate)
+        
+        # Кадры декодера маленькие (~1024 сэмпла), поэтому копим их и отдаем блоками ровно нужного размера
+        block_bytes = self.FEED_BLOCK_FRAMES * 2
+        pending = bytearray()
+        for frame in container.decode(stream):
+            for resampled in resampler.resample(frame):
+                pending += resampled.to_ndarray().tobytes()
+            while len(pending) >= block_bytes:
+                yield bytes(pending[:block_bytes])
+                del pending[:block_bytes]
+        
+        # Забираем остаток из ресемплера
+        for resampled in resampler.resample(None):
+            pending += resampled.to_ndarray().tobytes()
+        if pending:
+            yield bytes(pending)
+    
+    def _probe_duration(self, audio_path):
+        """Возвращает длительность файла в секундах (0, если не удалось определить)"""
+        # Для форматов libsndfile (WAV, FLAC, OGG...) длительность есть в заголовке - без запуска ffprobe
+        try:
+            return sf.info(audio_path).duration
+        except Exception:
+            pass
+        
+        try:
+            result = subprocess.run(
+                ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+                 "-of", "default=noprint_wrappers=1:nokey=1", audio_path],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=30
+            )
+            return float(result.stdout.decode('utf-8', errors='ignore').strip() or 0)
+        except Exception:
+            return 0
+    
+    def _enlarge_pipe(self, pipe):
+        """Увеличивает буфер канала ядра до PIPE_BUFFER_SIZE (только Linux)"""
+        if fcntl is None or not hasattr(fcntl, 'F_SETPIPE_SZ'):
+            return
+        try:
+            fcntl.fcntl(pipe.fileno(), fcntl.F_SETPIPE_SZ, self.PIPE_BUFFER_SIZE)
+        except OSError:
+            # Лимит /proc/sys/fs/pipe-max-size может быть меньше - остаемся с размером по умолчанию
+            pass
+    
+    def _transcribe_with_ffmpeg_pipe(self, audio_path, duration=None, input_options=()):
+        """Декодирует файл (или URL) через ffmpeg в PCM 16кГц моно и читает его из stdout без временного WAV"""
+        command = [
+            "ffmpeg",
+            "-loglevel", "error",
+            *self.FFMPEG_THREAD_OPTIONS,
+            *input_options,    # Параметры входа (например, HTTP заголовки)
+            "-i", audio_path,  # Входной файл
+            "-vn",             # Видеодорожки (если есть) не декодируем
+            "-f", "s16le",     # Сырой PCM 16 бит
+            "-ar", str(self.sample_rate),  # Частота дискретизации 16 кГц
+            "-ac", "1",        # Моно
+            "-"                # Пишем в stdout
+        ]
+        print(f"Выполняем команду: {' '.join(command)}")
+        
+        # Оцениваем количество сэмплов по длительности для отображения прогресса
+        if duration is None:
+            duration = self._probe_duration(audio_path)
+        total_frames = int(duration * self.sample_rate)
+        
+        # stderr пишем во временный файл, а не в канал: на поврежденном входе ffmpeg выводит строку
+        # на каждый плохой пакет, и переполненный канал stderr остановил бы его вместе с stdout
+        stderr_file = tempfile.TemporaryFile()
+        try:
+            proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file, bufsize=1 << 20)
+        except FileNotFoundError:
+            stderr_file.close()
+            return False, "FFmpeg не найден. Пожалуйста, установите FFmpeg и добавьте его в PATH."
+        
+        # Увеличиваем буфер канала, чтобы ffmpeg мог уйти дальше вперед, пока работает распознаватель
+        self._enlarge_pipe(proc.stdout)
+        
+        def blocks():
+            # Читаем блоками по FEED_BLOCK_FRAMES сэмплов, как и при чтении WAV
+            while True:
+                data = proc.stdout.read(self.FEED_BLOCK_FRAMES * 2)
+                if not data:
+                    break
+                yield data
+        
+        try:
+            success, text = self._recognize_blocks(self._prefetch_blocks(blocks()), total_frames, self.sample_rate)
+        finally:
+            proc.stdout.close()
+            proc.wait()
+            stderr_file.seek(0)
+            stderr = stderr_file.read()
+            stderr_file.close()
+        
+        if proc.returncode != 0:
+            return False, f"Ошибка FFmpeg: {stderr.decode('utf-8', errors='ignore')}"
+        
+        return success, text
+    
+    def _prefetch_blocks(self, blocks):
+        """Читает блоки в отдельном потоке, чтобы декодирование шло параллельно с распознаванием"""
+        block_queue = queue.Queue(maxsize=self.PREFETCH_BLOCKS)
+        stop_event = threading.Event()
+        end_marker = object()
+        
+        def put(item):
+            # Не блокируемся навсегда, если потребитель уже прекратил чтение
+            while not stop_event.is_set():
+                try:
+                    block_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def producer():
+            try:
+                for data in blocks:
+                    if not put(data):
+                        return
+                put(end_marker)
+            except Exception as e:
+                # Ошибку декодера пробрасываем в поток распознавания
+                put(e)
+        
+        thread = threading.Thread(target=producer, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = block_queue.get()
+                if item is end_marker:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop_event.set()
+            thread.join()
+    
+    def _recognize_blocks(self, blocks, total_frames, sample_rate):
+        """Распознает поток блоков PCM 16 бит моно и возвращает (успех, текст)"""
+        # Переиспользуем распознаватель для этой модели и частоты, сбрасывая состояние предыдущего файла
+        # (модель в ключе: self.model может смениться без load_model - например, фоновой загрузкой)
+        model = self.model
+        rec_key = (id(model), sample_rate)
+        rec = self.recognizers.get(rec_key)
+        if rec is None:
+            rec = KaldiRecognizer(model, sample_rate)
+            self.recognizers[rec_key] = rec
+        else:
+            rec.Reset()
+        
+        # Собираем результаты транскрибации
+        result_text = []
+        
+        # Читаем аудио по частям и распознаем
+        print("Обработка аудио...")
+        processed_frames = 0
+        printed_decile = -1
+        # Множитель для перевода сэмплов в проценты считаем один раз, а не на каждом блоке
+        percent_per_frame = 100.0 / total_frames if total_frames else 0.0
+        
+        # Устанавливаем начальный прогресс транскрибации
+        self.update_progress(45)
+        
+        try:
+            for data in blocks:
+                # Обновляем прогресс
+                processed_frames += len(data) // 2
+                progress = min(100, int(processed_frames * percent_per_frame))
                 
-                # Проверяем, что есть какой-то результат
-                if not full_text.strip():
-                    return False, "Не удалось распознать текст в аудио (пустой результат)"
+                # Рассчитываем общий прогресс (от 45% до 95%)
+                total_progress = 45 + int(progress * 0.5)  # 50% диапазона для транскрибации
+                self.update_progress(total_progress)
                 
-                print(f"Транскрибация завершена, получено {len(full_text.split())} слов")
-                self.update_progress(100)
-                return True, full_text
+                # Печатаем прогресс только при переходе через очередные 10%
+                if progress // 10 > printed_decile:
+                    printed_decile = progress // 10
+                    print(f"Прогресс транскрибации: {printed_decile * 10}%")
                 
-            except Exception as wav_err:
-                print(f"Ошибка при обработке WAV файла: {str(wav_err)}")
-                return False, f"Ошибка при обработке WAV файла: {str(wav_err)}"
-            
-        except Exception as e:
-            print(f"Ошибка при транскрибации аудио: {str(e)}")
-            return False, f"Ошибка при транскрибации: {str(e)}"
+                # Отправляем данные в распознаватель. Result() нужно забирать на каждой границе фразы:
+                # FinalResult() вернет только последнюю фразу, а не весь текст
+                if rec.AcceptWaveform(data):
+                    text = _result_text(rec.Result())
+                    if text.strip():
+                        result_text.append(text)
+        finally:
+            # Останавливаем фоновое чтение, если распознавание прервалось
+            if hasattr(blocks, 'close'):
+                blocks.close()
+        
+        # Получаем финальный результат
+        text = _result_text(rec.FinalResult())
+        if text.strip():
+            result_text.append(text)
+        
+        return self._finish_transcript(result_text)
+    
+    def _finish_transcript(self, result_text):
+        """Склеивает распознанные фразы в итоговый текст"""
+        full_text = " ".join(result_text)
+        
+        # Проверяем, что есть какой-то результат
+        if not full_text.strip():
+            return False, "Не удалось распознать текст в аудио (пустой результат)"
+        
+        print(f"Транскрибация завершена, получено {len(full_text.split())} слов")
+        self.update_progress(100)
+        return True, full_text
             
-    def _is_wav_16khz_mono(self, file_path):
-        """Проверяет, соответствует ли WAV файл требованиям 16кГц, моно"""
+    def _probe_audio(self, file_path):
+        """Читает заголовок файла через soundfile (None, если формат не поддерживается)"""
         try:
-            if not file_path.lower().endswith('.wav'):
-                return False
-                
-            wf = wave.open(file_path, 'rb')
-            is_valid = (wf.getnchannels() == 1 and wf.getframerate() == 16000)
-            wf.close()
-            return is_valid
-        except:
-            return False
-            
-    def _convert_with_ffmpeg(self, input_path, output_path):
-        """Использует FFmpeg для конвертации аудио"""
+            return sf.info(file_path)
+        except Exception:
+            return None
+    
+    def _transcribe_with_soundfile(self, audio_path, total_frames):
+        """Распознает файл 16кГц моно, читая сэмплы int16 блоками через soundfile"""
         try:
-            # Используем ffmpeg для конвертации
-            command = [
-                "ffmpeg", 
-                "-y",  # Перезаписывать существующие файлы
-                "-i", input_path,  # Входной файл
-                "-ar", "16000",  # Частота дискретизации 16 кГц
-                "-ac", "1",      # Моно
-                "-bits_per_raw_sample", "16",  # 16 бит
-                output_path  # Выходной файл
-            ]
-            print(f"Выполняем команду: {' '.join(command)}")
-            result = subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            
-            # Проверяем, создан ли файл
-            if not os.path.exists(output_path):
-                stderr = result.stderr.decode('utf-8', errors='ignore')
-                return False, f"Не удалось конвертировать аудио. FFmpeg ошибка: {stderr}"
-            
-            return True, output_path
-                
-        except FileNotFoundError:
-            return False, "FFmpeg не найден. Пожалуйста, установите FFmpeg и добавьте его в PATH."
-        except subprocess.CalledProcessError as e:
-            stderr = e.stderr.decode('utf-8', errors='ignore')
-            return False, f"Ошибка FFmpeg: {stderr}"
+            blocks = (block.tobytes() for block in sf.blocks(audio_path, blocksize=self.FEED_BLOCK_FRAMES, dtype='int16'))
+            return self._recognize_blocks(blocks, total_frames, self.sample_rate)
+        except Exception as sf_err:
+            print(f"Ошибка при чтении аудио через soundfile: {str(sf_err)}")
+            return False, f"Ошибка при чтении аудио: {str(sf_err)}"
             
-    def _convert_with_sounddevice(self, input_path, output_path):
-        """Использует sounddevice и soundfile для конвертации аудио"""
+    def _convert_with_sounddevice(self, input_path):
+        """Использует soundfile для конвертации аудио в PCM 16кГц 16 бит моно (возвращает байты)"""
         try:
             # Загружаем аудио файл с помощью soundfile
             print(f"Конвертация {input_path} с использованием sounddevice")
             
             try:
-                # Пытаемся прочитать файл с помощью soundfile
-                data, fs = sf.read(input_path)
+                # Пытаемся прочитать файл с помощью soundfile (float32 вдвое компактнее float64
+                # по умолчанию, а точности для PCM 16 бит достаточно)
+                data, fs = sf.read(input_path, dtype='float32', always_2d=False)
             except Exception as sf_err:
                 print(f"Ошибка soundfile: {sf_err}")
                 # Если формат не поддерживается soundfile, используем moviepy
                 try:
+                    # MoviePy тяжелый, поэтому импортируем его только когда он действительно нужен
+                    from moviepy.editor import VideoFileClip
                     audio_clip = VideoFileClip(input_path).audio
                     temp_audio_path = os.path.join(self.temp_dir, "temp_audio.wav")
                     audio_clip.write_audiofile(
@@ -338,39 +1012,34 @@ class Transcriber:
                         logger=None        # Отключаем логирование
                     )
                     audio_clip.close()
-                    data, fs = sf.read(temp_audio_path)
+                    data, fs = sf.read(temp_audio_path, dtype='float32', always_2d=False)
                 except Exception as mp_err:
                     return False, f"Не удалось прочитать аудио файл: {str(mp_err)}"
             
             # Преобразуем в моно, если это стерео
-            if len(data.shape) > 1 and data.shape[1] > 1:
-                data = np.mean(data, axis=1)
+            data = to_mono(data)
             
-            # Ресемплирование до 16кГц, если необходимо
-            if fs != 16000:
+            # Ресемплирование до 16кГц, если необходимо (после сведения в моно - вдвое меньше работы)
+            if fs != 16000 and scipy_available:
+                # Полифазный фильтр с защитой от наложения спектров
+                divisor = math.gcd(int(fs), 16000)
+                data = signal.resample_poly(data, 16000 // divisor, int(fs) // divisor).astype(np.float32, copy=False)
+            elif fs != 16000:
                 # Простое ресемплирование для аудио (не самое качественное, но работает)
-                ratio = 16000.0 / fs
-                n_samples = int(len(data) * ratio)
-                data = np.interp(
-                    np.linspace(0, len(data) - 1, n_samples),
-                    np.arange(len(data)),
-                    data
-                )
+                data = linear_resample(data, fs, 16000)
             
-            # Записываем в WAV формат
-            sf.write(output_path, data, 16000, subtype='PCM_16')
-            
-            # Проверяем, создан ли файл
-            if not os.path.exists(output_path):
-                return False, "Не удалось создать WAV файл с использованием sounddevice"
-                
-            return True, output_path
+            # Переводим в 16 бит так же, как это делал бы libsndfile при записи PCM_16
+            np.clip(data, -1.0, 1.0, out=data)
+            data *= 32767
+            # Округляем, а не отбрасываем дробную часть - иначе сигнал смещался бы к нулю на 1 младший бит
+            np.rint(data, out=data)
+            return True, data.astype('<i2').tobytes()
         except Exception as e:
             print(f"Ошибка при конвертации аудио: {str(e)}")
             return False, f"Ошибка при конвертации аудио: {str(e)}"
     
     def extract_audio_from_video(self, video_path):
-        """Извлечение аудио из видео файла"""
+        """Извлечение аудио из видео файла в WAV (нужно, только если требуется сам файл с аудио)"""
         try:
             # Убедимся, что временная директория существует
             if not os.path.exists(self.temp_dir):
@@ -383,16 +1052,43 @@ class Transcriber:
             self.update_progress(75)
             
             if self.use_ffmpeg:
-                # Используем MoviePy (и ffmpeg под капотом)
-                video = VideoFileClip(video_path)
-                video.audio.write_audiofile(audio_path, 
-                                           codec='pcm_s16le',  # 16-бит PCM
-                                           ffmpeg_params=["-ar", "16000", "-ac", "1"])  # 16кГц моно
-                video.close()
+                # Вызываем ffmpeg напрямую: берем только первую аудиодорожку, видео не декодируется
+                command = [
+                    "ffmpeg",
+                    "-y",                     # Перезаписывать существующие файлы
+                    "-loglevel", "error",     # В stderr только ошибки
+                    *self.FFMPEG_THREAD_OPTIONS,
+                    "-vn",                    # Без видео
+                    "-i", video_path,         # Входной файл
+                    "-map", "0:a:0",          # Только первая аудиодорожка
+                    "-ar", "16000",           # Частота дискретизации 16 кГц
+                    "-ac", "1",               # Моно
+                    "-acodec", "pcm_s16le",   # 16-бит PCM
+                    audio_path
+                ]
+                result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+                if result.returncode != 0:
+                    stderr = result.stderr.decode('utf-8', errors='ignore')
+                    return False, f"Ошибка FFmpeg при извлечении аудио: {stderr}"
+                self.update_progress(90)
+            elif av_available:
+                # Без ffmpeg декодируем только аудиодорожку через PyAV, не загружая видео в MoviePy
+                with av.open(video_path) as container:
+                    if not container.streams.audio:
+                        return False, "В видеофайле нет аудиодорожки"
+                    
+                    with wave.open(audio_path, 'wb') as wf:
+                        wf.setnchannels(1)
+                        wf.setsampwidth(2)  # 16 бит
+                        wf.setframerate(self.sample_rate)
+                        for data in self._av_pcm_blocks(container, container.streams.audio[0]):
+                            wf.writeframes(data)
                 self.update_progress(90)
             else:
                 # Используем альтернативный метод без ffmpeg
                 try:
+                    # MoviePy тяжелый, поэтому импортируем его только когда он действительно нужен
+                    from moviepy.editor import VideoFileClip
                     # Загружаем видео
                     print("Загрузка видео...")
                     self.update_progress(75)
@@ -414,8 +1110,7 @@ class Transcriber:
                         audio_data = video.audio.to_soundarray(fps=16000, nbytes=2, buffersize=20000)
                         
                         # Преобразуем в моно, если стерео
-                        if len(audio_data.shape) > 1 and audio_data.shape[1] > 1:
-                            audio_data = np.mean(audio_data, axis=1)
+                        audio_data = to_mono(audio_data)
                         
                         # Сохраняем в WAV файл
                         sf.write(audio_path, audio_data, 16000, subtype='PCM_16')
@@ -469,8 +1164,10 @@ class Transcriber:
                                     block_duration = 10  # секунд
                                     num_blocks = int(np.ceil(video.duration / block_duration))
                                     
-                                    # Создаем массив для хранения всего аудио
-                                    full_audio = np.array([], dtype=np.float32)
+                                    # Массив для всего аудио выделяем сразу (с запасом на округление),
+                                    # блоки записываются в него по смещению без перевыделений
+                                    full_audio = np.empty(int(np.ceil(video.duration * 16000)) + 16000, dtype=np.float32)
+                                    write_pos = 0
                                     
                                     for i in range(num_blocks):
                                         start_time = i * block_duration
@@ -486,17 +1183,22 @@ class Transcriber:
                                             block_audio = block_clip.audio.to_soundarray(fps=16000, nbytes=2)
                                             
                                             # Если стерео, преобразуем в моно
-                                            if len(block_audio.shape) > 1 and block_audio.shape[1] > 1:
-                                                block_audio = np.mean(block_audio, axis=1)
-                                                
-                                            # Добавляем к полному аудио
-                                            full_audio = np.append(full_audio, block_audio)
+                                            block_audio = np.ravel(to_mono(block_audio))
                                             
                                         except Exception as block_err:
                                             print(f"Ошибка при обработке блока {i+1}: {block_err}")
                                             # Добавляем тишину вместо ошибочного блока
                                             silence_duration = end_time - start_time
-                                            full_audio = np.append(full_audio, np.zeros(int(silence_duration * 16000), dtype=np.float32))
+                                            block_audio = np.zeros(int(silence_duration * 16000), dtype=np.float32)
+                                        
+                                        # Добавляем к полному аудио (увеличиваем массив, если запаса не хватило)
+                                        end_pos = write_pos + block_audio.size
+                                        if end_pos > full_audio.size:
+                                            grown = np.empty(max(end_pos, full_audio.size * 2), dtype=np.float32)
+                                            grown[:write_pos] = full_audio[:write_pos]
+                                            full_audio = grown
+                                        full_audio[write_pos:end_pos] = block_audio
+                                        write_pos = end_pos
                                         
                                         # Закрываем подклип
                                         block_clip.close()
@@ -506,7 +1208,7 @@ class Transcriber:
                                         self.update_progress(progress)
                                     
                                     # Сохраняем полное аудио
-                                    sf.write(audio_path, full_audio, 16000, subtype='PCM_16')
+                                    sf.write(audio_path, full_audio[:write_pos], 16000, subtype='PCM_16')
                                     print(f"Аудио успешно извлечено блочным методом и сохранено в {audio_path}")
                             
                             except Exception as np_err:
@@ -519,15 +1221,16 @@ class Transcriber:
                     print(f"Ошибка при извлечении аудио из видео: {str(ve)}")
                     return False, f"Не удалось извлечь аудио из видео: {str(ve)}"
             
-            # Проверяем, что файл был создан
-            if not os.path.exists(audio_path):
+            # Проверяем, что файл был создан и не пуст (один вызов stat)
+            try:
+                audio_size = os.stat(audio_path).st_size
+            except FileNotFoundError:
                 return False, f"Не удалось создать аудиофайл: {audio_path}"
             
-            # Проверяем, что файл не пуст
-            if os.path.getsize(audio_path) == 0:
+            if audio_size == 0:
                 return False, "Созданный аудиофайл пуст"
                 
-            print(f"Аудио успешно извлечено, размер файла: {os.path.getsize(audio_path)/1024/1024:.2f} МБ")
+            print(f"Аудио успешно извлечено, размер файла: {audio_size/1024/1024:.2f} МБ")
             return True, audio_path
         except Exception as e:
             print(f"Ошибка при извлечении аудио из видео: {str(e)}")
@@ -540,12 +1243,18 @@ class Transcriber:
             return False, f"Видеофайл не найден: {video_path}"
             
         try:
-            # Получаем информацию о видео
-            video_info = VideoFileClip(video_path)
-            print(f"Видео загружено: {os.path.basename(video_path)}")
-            print(f"Длительность: {video_info.duration:.2f} сек")
-            print(f"Размер: {video_info.size[0]}x{video_info.size[1]}")
-            video_info.close()
+            # Длительность берем из заголовка через ffprobe, не открывая видео в MoviePy
+            print(f"Видео: {os.path.basename(video_path)}")
+            duration = None
+            if self.use_ffmpeg:
+                duration = self._probe_duration(video_path)
+                if duration:
+                    print(f"Длительность: {duration:.2f} сек")
+            
+            if av_available or self.use_ffmpeg:
+                # Аудиодорожку декодируем прямо в распознаватель, без промежуточного WAV
+                print("\nТранскрибация аудиодорожки видео")
+                return self.transcribe_video_streaming(video_path, duration)
             
             # Шаг 1: Извлекаем аудио из видео
             print("\nШаг 1: Извлечение аудио из видео")
@@ -560,9 +1269,33 @@ class Transcriber:
             print(f"Ошибка при обработке видео: {str(e)}")
             return False, f"Ошибка при обработке видео: {str(e)}"
     
+    def transcribe_video_streaming(self, video_path, duration=None):
+        """Транскрибация видео за один проход: аудиодорожка декодируется сразу в PCM 16кГц моно"""
+        self.update_progress(20)
+        if not self.model and not self.load_model():
+            return False, "Не удалось загрузить модель транскрибации"
+        
+        self.update_progress(40)
+        if av_available:
+            return self._transcribe_with_av(video_path)
+        if self.use_ffmpeg:
+            # Длительность уже известна - второй раз ffprobe не запускаем
+            return self._transcribe_with_ffmpeg_pipe(video_path, duration=duration)
+        return False, "Для потоковой транскрибации видео нужен PyAV или FFmpeg"
+    
     def download_youtube(self, url):
         """Загрузка видео с YouTube"""
         try:
+            # pytubefix нужен только для YouTube, поэтому не загружаем его вместе с модулем
+            import pytubefix
+            import pytubefix.request
+            
+            # Запасная загрузка через pytubefix по умолчанию читает поток мелкими кусками -
+            # увеличиваем их, чтобы не делать тысячи мелких записей на диск
+            pytubefix.request.default_range_size = self.YOUTUBE_RANGE_SIZE
+            if hasattr(pytubefix.request, 'default_chunk_size'):
+                pytubefix.request.default_chunk_size = self.DOWNLOAD_CHUNK_SIZE
+            
             print(f"Загрузка видео с YouTube: {url}")
             self.update_progress(10)
             
@@ -581,47 +1314,37 @@ class Transcriber:
             print("Получение информации о видео...")
             self.update_progress(15)
             
-            # Добавляем обработку ошибок сети с повтором
-            max_retries = 3
-            connection_error = None
-            yt = None
-            
             # Настройка прокси для обхода возможных блокировок API
             # Используем только если есть проблемы с соединением
             proxies = None
             
-            for retry in range(max_retries):
-                try:
-                    # Создаем объект YouTube с дополнительными параметрами
-                    yt = pytubefix.YouTube(
-                        url,
-                        use_oauth=False,
-                        allow_oauth_cache=True,
-                        proxies=proxies
-                    )
-                    # Проверяем, что можем получить базовую информацию
-                    if yt.title:
-                        break
-                except pytubefix.exceptions.RegexMatchError as e:
-                    # Проблема с форматом URL
-                    return False, f"Неверный формат URL: {str(e)}"
-                except pytubefix.exceptions.VideoUnavailable as e:
-                    # Видео недоступно
-                    return False, f"Видео недоступно: {str(e)}"
-                except (pytubefix.exceptions.PytubeError, Exception) as e:
-                    connection_error = str(e)
-                    if "HTTP Error 400" in connection_error or "Bad Request" in connection_error:
-                        # Возможно, блокировка API, пробуем с другими параметрами
-                        if retry == 0:
-                            print("Получен HTTP Error 400, пробуем альтернативные методы доступа...")
-                    else:
-                        print(f"Ошибка при подключении (попытка {retry+1}/{max_retries}): {connection_error}")
-                    
-                    # При повторе пытаемся использовать другие параметры
-                    time.sleep(2 * (retry + 1))  # Увеличиваем задержку с каждой попыткой
+            def connect():
+                # Создаем объект YouTube с дополнительными параметрами
+                yt = pytubefix.YouTube(
+                    url,
+                    use_oauth=False,
+                    allow_oauth_cache=True,
+                    proxies=proxies
+                )
+                # Проверяем, что можем получить базовую информацию
+                if not yt.title:
+                    raise IOError("Не удалось получить информацию о видео")
+                return yt
             
-            if yt is None:
-                return False, f"Не удалось подключиться к YouTube после {max_retries} попыток: {connection_error}"
+            # Ошибки сети повторяем, ошибки в самом URL или видео - нет
+            try:
+                yt = self._retry(connect, "Подключение к YouTube", fatal_errors=(
+                    pytubefix.exceptions.RegexMatchError,
+                    pytubefix.exceptions.VideoUnavailable
+                ))
+            except pytubefix.exceptions.RegexMatchError as e:
+                # Проблема с форматом URL
+                return False, f"Неверный формат URL: {str(e)}"
+            except pytubefix.exceptions.VideoUnavailable as e:
+                # Видео недоступно
+                return False, f"Видео недоступно: {str(e)}"
+            except Exception as e:
+                return False, f"Не удалось подключиться к YouTube после {self.RETRY_ATTEMPTS} попыток: {e}"
             
             # Получаем и выводим информацию о видео
             try:
@@ -636,35 +1359,26 @@ class Transcriber:
             print("Получение доступных форматов видео...")
             self.update_progress(25)
             
-            try:
-                # Устанавливаем повторы для получения потоков
-                stream = None
-                streams_error = None
+            def find_stream():
+                # Сначала пробуем прогрессивные потоки (с аудио)
+                video_streams = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution')
                 
-                for retry in range(max_retries):
-                    try:
-                        # Сначала пробуем прогрессивные потоки (с аудио)
-                        video_streams = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution')
-                        
-                        # Ищем самое качественное видео с аудио
-                        stream = video_streams.last()
-                        if not stream:
-                            # Если не нашли прогрессивный поток, попробуем любой с аудио
-                            stream = yt.streams.filter(only_audio=False).first()
-                            
-                        if not stream:
-                            # Если всё ещё нет подходящего потока, возьмем только аудио
-                            stream = yt.streams.filter(only_audio=True).first()
-                        
-                        if stream:
-                            break
-                    except Exception as e:
-                        streams_error = str(e)
-                        print(f"Ошибка при получении потоков (попытка {retry+1}/{max_retries}): {streams_error}")
-                        time.sleep(2 * (retry + 1))
+                # Ищем самое качественное видео с аудио
+                stream = video_streams.last()
+                if not stream:
+                    # Если не нашли прогрессивный поток, попробуем любой с аудио
+                    stream = yt.streams.filter(only_audio=False).first()
+                    
+                if not stream:
+                    # Если всё ещё нет подходящего потока, возьмем только аудио
+                    stream = yt.streams.filter(only_audio=True).first()
                 
                 if not stream:
-                    return False, f"Не удалось найти подходящий поток для загрузки: {streams_error}"
+                    raise IOError("Не удалось найти подходящий поток для загрузки")
+                return stream
+            
+            try:
+                stream = self._retry(find_stream, "Получение потоков")
                 
                 print(f"Выбран поток: {getattr(stream, 'resolution', 'аудио')}, {getattr(stream, 'fps', 'N/A')}fps")
                 self.update_progress(30)
@@ -672,35 +1386,60 @@ class Transcriber:
                 print(f"Ошибка при получении потоков: {stream_err}")
                 return False, f"Ошибка при получении форматов видео: {stream_err}"
             
-            # Устанавливаем обработчик прогресса
+            # Прогресс загрузки пересчитываем в диапазон 30-70%
+            def download_progress(bytes_downloaded, total_size):
+                if total_size:
+                    self.update_progress(30 + int(bytes_downloaded * 40 / total_size))
+            
+            # Обработчик прогресса для загрузки средствами pytubefix
+            last_percent = -1
+            
             def progress_callback(stream, chunk, bytes_remaining):
+                nonlocal last_percent
                 total_size = stream.filesize
                 bytes_downloaded = total_size - bytes_remaining
-                percentage = (bytes_downloaded / total_size) * 100
+                percentage = bytes_downloaded * 100 // total_size
+                # Обновляем прогресс и печатаем только при смене целого процента
+                if percentage == last_percent:
+                    return
+                last_percent = percentage
                 # Пересчитываем прогресс для диапазона 30-70%
                 progress_value = 30 + int(percentage * 0.4)
                 self.update_progress(progress_value)
-                print(f"\rЗагрузка видео: {percentage:.1f}%", end="")
-            
-            # Регистрируем обработчик
-            yt.register_on_progress_callback(progress_callback)
+                print(f"\rЗагрузка видео: {percentage}%", end="")
             
             # Загружаем видео
             print("Начинаю загрузку видео...")
             try:
-                stream.download(output_path=self.temp_dir, filename="youtube_video.mp4")
+                try:
+                    # Размер потока известен заранее - загружаем его параллельными Range-запросами
+                    self._download_ranges(stream.url, video_path, stream.filesize, download_progress)
+                except Exception as range_err:
+                    print(f"Параллельная загрузка не удалась ({range_err}), загружаем одним потоком...")
+                    try:
+                        # Один поток, данные пишутся на диск по мере получения, без буферизации в памяти
+                        self._retry(lambda: self._download_file(stream.url, video_path, total_size=stream.filesize,
+                                                                on_progress=download_progress, parallel=False),
+                                    "Загрузка видео")
+                    except Exception as stream_err:
+                        # Последний вариант - штатная загрузка через pytubefix
+                        print(f"Потоковая загрузка не удалась ({stream_err}), загружаем через pytubefix...")
+                        yt.register_on_progress_callback(progress_callback)
+                        stream.download(output_path=self.temp_dir, filename="youtube_video.mp4")
                 print("\nЗагрузка видео завершена!")
                 self.update_progress(70)
             except Exception as download_err:
                 print(f"\nОшибка при загрузке видео: {download_err}")
                 return False, f"Ошибка при загрузке видео: {download_err}"
             
-            # Проверяем, что файл был загружен
-            if not os.path.exists(video_path):
+            # Проверяем, что файл был загружен (один вызов stat)
+            try:
+                video_size = os.stat(video_path).st_size
+            except FileNotFoundError:
                 return False, "Не удалось загрузить видео с YouTube"
                 
             print(f"Видео успешно загружено: {video_path}")
-            print(f"Размер файла: {os.path.getsize(video_path)/1024/1024:.2f} МБ")
+            print(f"Размер файла: {video_size/1024/1024:.2f} МБ")
             
             return True, video_path
         except Exception as e:
@@ -712,17 +1451,10 @@ class Transcriber:
         # Очищаем URL от лишних пробелов
         url = url.strip()
         
-        # Проверяем базовые шаблоны YouTube URL
-        youtube_patterns = [
-            r'(https?://)?(www\.)?(youtube\.com|youtu\.be|youtube-nocookie\.com)',
-            r'(https?://)?(www\.)?m\.youtube\.com',
-        ]
-        
-        # Проверяем, соответствует ли URL хотя бы одному шаблону
-        if not any(re.match(pattern, url) for pattern in youtube_patterns):
+        # Проверяем, соответствует ли URL хотя бы одному шаблону YouTube
+        if not any(pattern.match(url) for pattern in _YOUTUBE_URL_PATTERNS):
             # Если URL не соответствует шаблонам, проверим, не является ли это просто ID видео
-            video_id_pattern = r'^[a-zA-Z0-9_-]{11}$'
-            if re.match(video_id_pattern, url):
+            if _YOUTUBE_ID_RE.match(url):
                 # Если это похоже на ID видео, добавляем стандартный префикс
                 return f'https://www.youtube.com/watch?v={url}'
             else:
@@ -734,22 +1466,22 @@ class Transcriber:
         
         # Для формата youtu.be/ID
         if 'youtu.be' in url:
-            match = re.search(r'youtu\.be/([a-zA-Z0-9_-]+)', url)
+            match = _YOUTU_BE_RE.search(url)
             if match:
                 video_id = match.group(1)
         # Для формата youtube.com/watch?v=ID
         elif 'youtube.com/watch' in url:
-            match = re.search(r'[?&]v=([a-zA-Z0-9_-]+)', url)
+            match = _WATCH_ID_RE.search(url)
             if match:
                 video_id = match.group(1)
         # Для формата youtube.com/v/ID
         elif '/v/' in url:
-            match = re.search(r'/v/([a-zA-Z0-9_-]+)', url)
+            match = _V_PATH_ID_RE.search(url)
             if match:
                 video_id = match.group(1)
         # Для формата youtube.com/embed/ID
         elif '/embed/' in url:
-            match = re.search(r'/embed/([a-zA-Z0-9_-]+)', url)
+            match = _EMBED_ID_RE.search(url)
             if match:
                 video_id = match.group(1)
         
@@ -765,6 +1497,15 @@ class Transcriber:
         # Сбрасываем прогресс
         self.update_progress(5)
         
+        if yt_dlp_available and self.use_ffmpeg:
+            # Берем только аудиодорожку и сразу декодируем ее в распознаватель:
+            # видео не скачивается, на диск ничего не пишется
+            success, result = self._transcribe_youtube_audio_stream(url)
+            if success:
+                return success, result
+            print(f"Не удалось транскрибировать аудиопоток через yt-dlp: {result}")
+            print("Переходим к загрузке видео через pytubefix...")
+        
         # Шаг 1: Загрузка видео с YouTube
         print("Шаг 1: Загрузка видео с YouTube")
         success, video_path = self.download_youtube(url)
@@ -806,6 +1547,42 @@ class Transcriber:
         
         return result
     
+    def _transcribe_youtube_audio_stream(self, url):
+        """Транскрибирует аудиодорожку YouTube, передавая ее из сети через ffmpeg прямо в распознаватель"""
+        # Проверяем, что модель загружена
+        if not self.model:
+            print("Модель не загружена, загружаем...")
+            if not self.load_model():
+                return False, "Не удалось загрузить модель транскрибации"
+        
+        try:
+            url = self.normalize_youtube_url(url)
+            if not url:
+                return False, "Некорректный формат URL YouTube"
+            
+            print("Получение аудиопотока через yt-dlp...")
+            self.update_progress(15)
+            ydl_opts = {
+                'format': 'bestaudio/best',
+                'quiet': True,
+                'no_warnings': True,
+                'noplaylist': True,
+            }
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                info = ydl.extract_info(url, download=False)
+            
+            print(f"Название видео: {info.get('title')}")
+            print(f"Длительность: {info.get('duration')} сек")
+            self.update_progress(40)
+            
+            # Передаем ffmpeg те же HTTP заголовки, с которыми yt-dlp получил ссылку на поток
+            headers = "".join(f"{key}: {value}\r\n" for key, value in info.get('http_headers', {}).items())
+            input_options = ("-headers", headers) if headers else ()
+            return self._transcribe_with_ffmpeg_pipe(info['url'], duration=info.get('duration') or 0,
+                                                     input_options=input_options)
+        except Exception as e:
+            return False, f"Ошибка при получении аудиопотока YouTube: {str(e)}"
+    
     def transcribe_zoom_meeting(self, zoom_recording_path):
         """Транскрибация записи Zoom"""
         # Zoom сохраняет записи в формате mp4, поэтому используем метод для транскрибации видео
@@ -814,42 +1591,19 @@ class Transcriber:
     def transcribe_streaming_audio(self, audio_stream_url):
         """Транскрибация потокового аудио"""
         try:
-            # Сохраняем поток во временный файл
-            temp_audio_file = os.path.join(self.temp_dir, "stream_audio.wav")
-            
-            if self.use_ffmpeg:
-                # Используем ffmpeg для захвата потока
-                command = [
-                    "ffmpeg", 
-                    "-y",  # Перезаписывать существующие файлы
-                    "-i", audio_stream_url,  # Входной поток
-                    "-ar", "16000",  # Частота 16 кГц
-                    "-ac", "1",      # Моно
-                    "-f", "wav",     # Формат WAV
-                    temp_audio_file  # Выходной файл
-                ]
-                
-                # Запускаем команду
-                subprocess.run(command, check=True)
-            else:
-                # Используем sounddevice для записи и сохранения потока
+            if not av_available and not self.use_ffmpeg:
+                # Без ffmpeg поток захватить нечем - распознаем 10 секунд с микрофона
                 # Это временное решение, без настоящего потока
-                print("Запись аудио с микрофона на 10 секунд...")
-                
-                # Запись аудио с микрофона
-                myrecording = sd.rec(int(10 * self.sample_rate), 
-                                   samplerate=self.sample_rate,
-                                   channels=1,
-                                   dtype='int16')
-                sd.wait()  # Ожидаем окончания записи
-                
-                # Сохраняем запись в wav файл
-                sf.write(temp_audio_file, myrecording, self.sample_rate)
-                
-                print(f"Запись сохранена в {temp_audio_file}")
+                return self.record_microphone(10)
             
-            # Транскрибируем сохраненный аудиофайл
-            return self.transcribe_audio(temp_audio_file)
+            if not self.model and not self.load_model():
+                return False, "Не удалось загрузить модель транскрибации"
+            
+            # Поток декодируется в PCM 16кГц моно и сразу идет в распознаватель, без файла на диске
+            if av_available:
+                return self._transcribe_with_av(audio_stream_url)
+            # Длительность живого потока неизвестна - ffprobe не запускаем
+            return self._transcribe_with_ffmpeg_pipe(audio_stream_url, duration=0)
         except Exception as e:
             print(f"Ошибка при транскрибации потокового аудио: {str(e)}")
             return False, f"Ошибка при транскрибации потока: {str(e)}"
@@ -857,12 +1611,20 @@ class Transcriber:
     def process_audio_file(self, file_path):
         """Обработка аудио файла"""
         # Проверяем расширение файла
-        file_extension = os.path.splitext(file_path)[1].lower()
+        file_extension = os.path.splitext(file_path)[1].strip().lower()
+        
+        if file_extension in AUDIO_EXTENSIONS:
+            media_type = 'audio'
+        elif file_extension in VIDEO_EXTENSIONS:
+            media_type = 'video'
+        else:
+            # Расширение незнакомое или искажено - определяем тип по содержимому файла
+            media_type = sniff_media_type(file_path)
         
-        if file_extension in ['.mp3', '.wav', '.m4a', '.aac', '.flac']:
+        if media_type == 'audio':
             # Транскрибируем аудио напрямую
             return self.transcribe_audio(file_path)
-        elif file_extension in ['.mp4', '.avi', '.mov', '.mkv', '.webm']:
+        elif media_type == 'video':
             # Если это видеофайл, извлекаем аудио и транскрибируем
             return self.transcribe_video(file_path)
         else:
@@ -920,15 +1682,11 @@ class Transcriber:
         """Очистка временных файлов"""
         try:
             if os.path.exists(self.temp_dir):
-                for file_name in os.listdir(self.temp_dir):
-                    file_path = os.path.join(self.temp_dir, file_name)
-                    try:
-                        if os.path.isfile(file_path):
-                            os.unlink(file_path)
-                            print(f"Удален временный файл: {file_path}")
-                    except Exception as e:
-                        print(f"Ошибка при удалении {file_path}: {e}")
-                print("Временные файлы очищены")
+                # Папка создана через mkdtemp и принадлежит только транскрайберу - удаляем ее целиком
+                # (вместе с вложенными папками) и создаем заново пустой
+                shutil.rmtree(self.temp_dir, ignore_errors=True)
+                os.makedirs(self.temp_dir, exist_ok=True)
+                print(f"Временные файлы очищены: {self.temp_dir}")
             return True
         except Exception as e:
             print(f"Ошибка при очистке временных файлов: {str(e)}")
@@ -939,38 +1697,53 @@ class Transcriber:
         try:
             print(f"Запись аудио с микрофона на {duration} секунд...")
             
-            # Убедимся, что временная директория существует
-            if not os.path.exists(self.temp_dir):
-                os.makedirs(self.temp_dir, exist_ok=True)
-                
-            temp_audio_file = os.path.join(self.temp_dir, "mic_recording.wav")
-            
-            # Запись аудио с микрофона
-            myrecording = sd.rec(int(duration * self.sample_rate), 
-                               samplerate=self.sample_rate,
-                               channels=1,
-                               dtype='int16')
-            
-            # Ожидаем окончания записи
-            sd.wait()
-            
-            # Сохраняем запись в wav файл
-            sf.write(temp_audio_file, myrecording, self.sample_rate)
-            
-            print(f"Запись сохранена в {temp_audio_file}")
+            if not self.model and not self.load_model():
+                return False, "Не удалось загрузить модель транскрибации"
             
-            # Транскрибируем записанное аудио
-            return self.transcribe_audio(temp_audio_file)
+            # Звук с микрофона сразу идет в распознаватель, без WAV файла:
+            # текст готов практически сразу после окончания записи
+            total_frames = int(duration * self.sample_rate)
+            return self._recognize_blocks(self._microphone_blocks(total_frames), total_frames, self.sample_rate)
             
         except Exception as e:
             print(f"Ошибка при записи аудио с микрофона: {str(e)}")
             return False, f"Ошибка при записи аудио: {str(e)}"
     
+    def _microphone_blocks(self, total_frames):
+        """Читает с микрофона total_frames сэмплов PCM 16 бит моно блоками по MIC_BLOCK_FRAMES"""
+        # sounddevice нужен только для записи с микрофона - не загружаем PortAudio вместе с модулем
+        import sounddevice as sd
+        
+        audio_queue = queue.Queue()
+        
+        def callback(indata, frames, time_info, status):
+            if status:
+                print(f"Статус записи: {status}", file=sys.stderr)
+            audio_queue.put(bytes(indata))
+        
+        remaining = total_frames * 2
+        with sd.RawInputStream(samplerate=self.sample_rate, blocksize=self.MIC_BLOCK_FRAMES,
+                               dtype='int16', channels=1, callback=callback) as stream:
+            while remaining > 0:
+                try:
+                    data = audio_queue.get(timeout=self.MIC_READ_TIMEOUT)[:remaining]
+                except queue.Empty:
+                    # Устройство отключено или поток прерван ошибкой - callback'и больше не придут
+                    state = "остановлен" if not stream.active else "активен, но callback'и не приходят"
+                    raise IOError(f"Нет данных с микрофона {self.MIC_READ_TIMEOUT} сек: поток записи {state}")
+                remaining -= len(data)
+                yield data
+    
     def set_progress_callback(self, callback):
         """Устанавливает функцию обратного вызова для отображения прогресса"""
         self.progress_callback = callback
         
     def update_progress(self, progress):
-        """Обновляет прогресс, если установлен callback"""
+        """Обновляет прогресс, если установлен callback (не чаще раза в PROGRESS_INTERVAL секунд)"""
         if self.progress_callback:
+            # Частые обновления только нагружают GUI - пропускаем их, кроме завершения
+            now = time.monotonic()
+            if progress < 100 and now - self.last_progress_time < self.PROGRESS_INTERVAL:
+                return
+            self.last_progress_time = now
             self.progress_callback(progress) 
\ No newline at end of file
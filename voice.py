@@ -4,13 +4,35 @@ import torch
 import queue
 import sounddevice as sd
 import re
-import time
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from vosk import Model, KaldiRecognizer
 from agent import ask_agent
 from memory import save_to_memory
 
+# orjson (если установлен) разбирает результаты распознавания быстрее стандартного json
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# Поле "text" в результате Vosk - единственное, что нужно из JSON
+_RESULT_TEXT_RE = re.compile(r'"text"\s*:\s*"([^"]*)"')
+
+def _result_text(raw_result):
+    """Извлекает текст из JSON-результата Vosk без полного разбора JSON"""
+    match = _RESULT_TEXT_RE.search(raw_result)
+    if not match:
+        return ""
+    text = match.group(1)
+    if '\\' in text:
+        # Экранированные символы встречаются редко - в этом случае разбираем JSON целиком
+        return json_loads(raw_result).get("text", "")
+    return text
+
 # Константы
 SAMPLE_RATE = 16000
 VOSK_MODEL_PATH = "model_small"
@@ -24,10 +46,22 @@ MODEL_PATHS = {
     'en': os.path.join(SILERO_MODELS_DIR, 'en', 'model.pt')
 }
 
+# Модель Vosk загружается один раз и переиспользуется всеми вызовами распознавания
+vosk_model = None
+vosk_model_lock = threading.Lock()
+
+# Потоки Torch для синтеза: половина ядер, чтобы не отнимать процессор у распознавания Vosk
+TTS_NUM_THREADS = max(1, (os.cpu_count() or 2) // 2)
+
 # Глобальные переменные для TTS
 models = {}
 tts_model_loaded = False
 pyttsx3_engine = None
+# TTS инициализируется при первом озвучивании, а не при импорте модуля
+tts_initialized = False
+tts_init_lock = threading.Lock()
+# Синтез в смешанной точности BF16 (включается при инициализации, если процессор его поддерживает)
+tts_bf16_enabled = False
 
 # Попытка импорта резервной библиотеки TTS
 try:
@@ -98,46 +132,102 @@ def load_model(lang):
         print(f"Ошибка загрузки модели {lang}: {e}")
         return False
 
+def cpu_supports_bf16():
+    """Проверка аппаратной поддержки BF16 (AVX512-BF16/AMX) на процессоре"""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+def apply_tts(lang, **kwargs):
+    """Синтез речи моделью Silero; на процессорах с поддержкой BF16 - в смешанной точности"""
+    global tts_bf16_enabled
+    
+    # Число потоков Torch - настройка всего процесса (ее используют и эмбеддинги в
+    # document_processor), поэтому ограничиваем его только на время синтеза и затем возвращаем
+    previous_threads = torch.get_num_threads()
+    torch.set_num_threads(TTS_NUM_THREADS)
+    try:
+        # Градиенты при синтезе не нужны: inference_mode отключает граф autograd и счетчики версий тензоров.
+        # Режим действует только в текущем потоке, поэтому включается здесь, а не при инициализации
+        with torch.inference_mode():
+            if tts_bf16_enabled:
+                try:
+                    with torch.autocast('cpu', dtype=torch.bfloat16):
+                        return models[lang].apply_tts(**kwargs).float()
+                except Exception as e:
+                    # Модель не поддерживает BF16 - больше не пытаемся и синтезируем в FP32
+                    print(f"Синтез в BF16 недоступен, используем FP32: {e}")
+                    tts_bf16_enabled = False
+            
+            return models[lang].apply_tts(**kwargs)
+    finally:
+        torch.set_num_threads(previous_threads)
+
 def init_tts():
-    """Инициализация всей системы TTS"""
-    global tts_model_loaded
+    """Инициализация всей системы TTS (выполняется один раз)"""
+    global tts_initialized
+    
+    with tts_init_lock:
+        if tts_initialized:
+            return
+        tts_initialized = True
+        _init_tts_models()
+
+def _init_tts_models():
+    """Загрузка резервного и основных движков TTS"""
+    global tts_model_loaded, tts_bf16_enabled
+    
+    tts_bf16_enabled = cpu_supports_bf16()
     
     # Инициализация pyttsx3 как резервной системы
     pyttsx3_initialized = init_pyttsx3()
     
-    # Пытаемся загрузить русскую модель
-    if download_model('ru') and load_model('ru'):
-        tts_model_loaded = True
+    # Русскую и английскую модели загружаем параллельно: загрузка по сети и чтение
+    # с диска отпускают GIL, поэтому время запуска определяется более медленной моделью
+    with ThreadPoolExecutor(max_workers=len(MODELS_URLS)) as executor:
+        futures = {lang: executor.submit(lambda lang=lang: download_model(lang) and load_model(lang))
+                   for lang in MODELS_URLS}
+        results = {lang: future.result() for lang, future in futures.items()}
     
-    # Пытаемся загрузить английскую модель
-    download_model('en') and load_model('en')
+    # Основная модель - русская
+    if results['ru']:
+        tts_model_loaded = True
 
 def split_text_into_chunks(text, max_chunk_size=1000):
     """Делит текст на части, длина каждой не превышает max_chunk_size символов"""
     # Разбиваем текст на предложения
     sentences = re.split(r'(?<=[.!?])\s+', text)
     chunks = []
-    current_chunk = ""
+    # Предложения текущего фрагмента копим в списке и склеиваем один раз через join
+    current_chunk = []
+    # Длина фрагмента с учетом пробела после каждого предложения
+    current_length = 0
 
     for sentence in sentences:
         # Если добавление очередного предложения не превысит лимит,
         # то добавляем его к текущему фрагменту
-        if len(current_chunk) + len(sentence) + 1 <= max_chunk_size:
-            current_chunk += sentence + " "
+        if current_length + len(sentence) + 1 <= max_chunk_size:
+            current_chunk.append(sentence)
+            current_length += len(sentence) + 1
         else:
             if current_chunk:
-                chunks.append(current_chunk.strip())
-            current_chunk = sentence + " "
+                chunks.append(" ".join(current_chunk).strip())
+            current_chunk = [sentence]
+            current_length = len(sentence) + 1
     
     if current_chunk:
-        chunks.append(current_chunk.strip())
+        chunks.append(" ".join(current_chunk).strip())
     
     return chunks
 
+# Таблица для str.translate, удаляющая кириллические буквы (А-я, ё, і, ї, є, ґ в обоих регистрах)
+_CYRILLIC_DELETE_TABLE = str.maketrans('', '', ''.join(map(chr, range(ord('А'), ord('я') + 1))) + 'ёіїєґЁІЇЄҐ')
+
 def detect_language(text):
     """Простое определение языка текста"""
-    # Подсчитываем кириллические символы
-    cyrillic_count = sum(1 for char in text if 'а' <= char.lower() <= 'я' or char.lower() in 'ёіїєґ')
+    # Подсчитываем кириллические символы: удаление через translate выполняется целиком в C
+    cyrillic_count = len(text) - len(text.translate(_CYRILLIC_DELETE_TABLE))
     
     # Если более 50% символов кириллические, считаем текст русским
     if cyrillic_count / max(1, len(text)) > 0.5:
@@ -165,20 +255,57 @@ def speak_text_silero(text, speaker='baya', sample_rate=48000, lang=None):
         # Разбиваем текст на части, если он длинный
         chunks = split_text_into_chunks(text)
         
-        for i, chunk in enumerate(chunks):
-            if i > 0:
-                time.sleep(0.3)  # Пауза между частями
+        # Следующая часть синтезируется в отдельном потоке, пока играет текущая
+        audio_queue = queue.Queue(maxsize=1)
+        stop_event = threading.Event()
+        
+        def put(item):
+            # Не блокируемся навсегда, если воспроизведение прервалось
+            while not stop_event.is_set():
+                try:
+                    audio_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def synthesize():
+            try:
+                for chunk in chunks:
+                    if stop_event.is_set():
+                        return
+                    audio = apply_tts(
+                        lang,
+                        text=chunk, 
+                        speaker=speaker,
+                        sample_rate=sample_rate,
+                        put_accent=True,
+                        put_yo=True
+                    )
+                    if not put(audio):
+                        return
+                put(None)
+            except Exception as e:
+                put(e)
+        
+        producer = threading.Thread(target=synthesize, daemon=True)
+        producer.start()
+        
+        try:
+            while True:
+                audio = audio_queue.get()
+                if audio is None:
+                    break
+                if isinstance(audio, Exception):
+                    raise audio
                 
-            audio = models[lang].apply_tts(
-                text=chunk, 
-                speaker=speaker,
-                sample_rate=sample_rate,
-                put_accent=True,
-                put_yo=True
-            )
-            
-            sd.play(audio, sample_rate)
-            sd.wait()
+                sd.play(audio, sample_rate)
+                sd.wait()
+        finally:
+            # Останавливаем синтез и дожидаемся потока: иначе следующий вызов
+            # запустил бы apply_tts на той же модели одновременно с ним
+            stop_event.set()
+            producer.join()
         
         return True
     except Exception as e:
@@ -205,6 +332,10 @@ def speak_text(text, speaker='baya'):
     if not text:
         return
     
+    # Модели TTS загружаем только когда они впервые понадобились
+    if not tts_initialized:
+        init_tts()
+    
     # Пытаемся озвучить через Silero
     if tts_model_loaded and speak_text_silero(text, speaker):
         return
@@ -225,18 +356,29 @@ def check_vosk_model():
         return False
     return True
 
+def get_vosk_model():
+    """Возвращает модель распознавания речи, загружая ее с диска только при первом вызове"""
+    global vosk_model
+    with vosk_model_lock:
+        if vosk_model is None:
+            vosk_model = Model(VOSK_MODEL_PATH)
+        return vosk_model
+
 def recognize_speech():
     """Распознавание речи с микрофона"""
     if not check_vosk_model():
         raise Exception("Модель распознавания речи не найдена")
     
     try:
-        model = Model(VOSK_MODEL_PATH)
-        q = queue.Queue()
+        model = get_vosk_model()
+        # SimpleQueue реализована на C: put в callback'е дешевле, чем у Queue с ее условными переменными
+        q = queue.SimpleQueue()
 
         def callback(indata, frames, time, status):
             if status:
                 print("Ошибка:", status, file=sys.stderr)
+            # Буфер indata действителен только внутри callback'а, а Vosk принимает только bytes,
+            # поэтому одно копирование здесь необходимо
             q.put(bytes(indata))
 
         print("🎤 Скажи что-нибудь (Ctrl+C для выхода)...")
@@ -246,8 +388,7 @@ def recognize_speech():
             while True:
                 data = q.get()
                 if rec.AcceptWaveform(data):
-                    result = json.loads(rec.Result())
-                    return result.get("text", "")
+                    return _result_text(rec.Result())
     except Exception as e:
         print(f"Ошибка при распознавании речи: {e}")
         raise
@@ -283,6 +424,3 @@ def run_voice():
 
     except KeyboardInterrupt:
         print("\nГолосовой режим завершён.")
-
-# Инициализируем TTS при импорте модуля
-init_tts() 
\ No newline at end of file